@@ -0,0 +1,437 @@
+"""End-to-end refresh cycle benchmark against local Influx and Fronius stand-ins
+
+    python bench.py --fonts path/to/bdf --cycles 5 --latency 50
+    python bench.py --fonts path/to/bdf --cycles 5 --latency 500 --cooldown 2 \\
+        --vary --setting TTL_PV_15MIN=0 --async
+
+Starts both stand-in servers in a child process, runs EnergyMonitor.step()
+through the CPython fallback of network.py with the framebuffer backend
+and reports per-phase latency (query, parse, render, refresh), requests,
+bytes transferred and peak Python heap of the client.
+
+The Influx stand-in answers every named yield() of a Flux script with one
+table per filtered field, replayed from <influx-dir>/<name>.csv when such
+a recording exists. Like Influx it leaves out annotation rows when the
+JSON request body asks for a dialect without them, and other columns than
+result, table, _field and _value after keep(columns: ["_field", "_value"]).
+Both stand-ins gzip their responses when the request accepts it, and
+--bandwidth delays them by their size to emulate a slow link. The response
+size of every planned dashboard query is reported annotated, compact and
+compact gzipped.
+The Fronius stand-in serves <fronius-file> or a built-in power flow
+document, and a built-in smart meter document.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Raw values by field and range start, as the dashboard metrics read them;
+# calendar ranges start at a Unix time, 'day' within the last day
+CANNED_FIELDS = {
+    ('StateOfCharge_Relative', '-7d'): 87.5,
+    ('StateOfCharge_Relative', '-1h'): 64.0,
+    ('E_Grid_pos', 'year'): 1234500.0,
+    ('E_Grid_pos', 'day'): 3200.0,
+    ('E_Grid_neg', 'year'): 4321000.0,
+    ('E_Grid_neg', 'day'): 12700.0,
+    ('E_PV', 'year'): 7654300.0,
+    ('E_PV', 'day'): 21400.0,
+    ('E_Load', 'year'): 5432100.0,
+    ('P_PV', '-15m'): 3456.0,
+}
+
+# Year counter lookups by result suffix
+CANNED_COUNTERS = {
+    '_sum': 5000000.0,
+    '_last': 9000000.0,
+    '_new': 9000500.0,
+}
+
+CANNED_FRONIUS = {
+    'Body': {
+        'Data': {
+            'Inverters': {
+                '1': {'DT': 1, 'E_Day': 21400.0, 'E_Total': 45000000.0, 'E_Year': 7654300.0,
+                      'P': 3400, 'SOC': 64.0, 'Battery_Mode': 'normal'},
+            },
+            'Site': {
+                'E_Day': 21400.0, 'E_Total': 45000000.0, 'E_Year': 7654300.0,
+                'Meter_Location': 'grid', 'Mode': 'bidirectional',
+                'P_Akku': -1200.0, 'P_Grid': -800.0, 'P_Load': -1456.0, 'P_PV': 3456.0,
+                'rel_Autonomy': 100.0, 'rel_SelfConsumption': 42.0,
+            },
+            'Version': '12',
+        },
+    },
+    'Head': {
+        'RequestArguments': {},
+        'Status': {'Code': 0, 'Reason': '', 'UserMessage': ''},
+        'Timestamp': '2025-06-01T12:00:00+02:00',
+    },
+}
+
+CANNED_METER = {
+    'Body': {
+        'Data': {
+            'Details': {'Manufacturer': 'Fronius', 'Model': 'Smart Meter TS 65A-3'},
+            'EnergyReal_WAC_Sum_Consumed': 8123456.0,
+            'EnergyReal_WAC_Sum_Produced': 15234567.0,
+            'PowerReal_P_Sum': -800.0,
+        },
+    },
+    'Head': CANNED_FRONIUS['Head'],
+}
+
+# Flux script up to a named yield, and the projection InfluxAPI appends
+_YIELD = re.compile(r'(.*?)yield\(name: "([^"]+)"\)', re.S)
+_KEEP_VALUE = 'keep(columns: ["_field", "_value"])'
+_FIELD = re.compile(r'r\["_field"\] == "([^"]+)"')
+_START = re.compile(r'range\(start: ([^,)]+)')
+
+# Columns of a stand-in table: name, datatype, group, default
+_COLUMNS = [
+    ('result', 'string', 'false', '_result'),
+    ('table', 'long', 'false', ''),
+    ('_start', 'dateTime:RFC3339', 'true', ''),
+    ('_stop', 'dateTime:RFC3339', 'true', ''),
+    ('_time', 'dateTime:RFC3339', 'false', ''),
+    ('_value', 'double', 'false', ''),
+    ('_field', 'string', 'true', ''),
+    ('_measurement', 'string', 'true', ''),
+]
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def add(self, bytes_in, bytes_out):
+        with self.lock:
+            self.requests += 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+
+    def as_dict(self):
+        with self.lock:
+            return {'requests': self.requests, 'bytes_in': self.bytes_in, 'bytes_out': self.bytes_out}
+
+    def reset(self):
+        with self.lock:
+            self.requests = self.bytes_in = self.bytes_out = 0
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    options = None
+    stats = None
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, body, content_type, bytes_in=0):
+        compress = 'gzip' in self.headers.get('Accept-Encoding', '')
+        if compress:
+            body = gzip.compress(body)
+        delay = self.options.latency / 1000.0
+        if self.options.bandwidth:
+            delay += len(body) * 8 / (self.options.bandwidth * 1000.0)
+        time.sleep(delay)
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        if compress:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.stats.add(bytes_in, len(body))
+
+    def _stats(self):
+        if self.command == 'DELETE':
+            self.stats.reset()
+        body = json.dumps(self.stats.as_dict()).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_DELETE(self):
+        self._stats()
+
+
+class InfluxHandler(StandInHandler):
+    def do_GET(self):
+        self._stats()
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        script = self.rfile.read(length).decode()
+        if self.path.startswith('/api/v2/write'):
+            # Telemetry, accepted and dropped
+            self.send_response(204)
+            self.end_headers()
+            self.stats.add(length, 0)
+            return
+        annotations = True
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            query = json.loads(script)
+            script = query['query']
+            annotations = bool(query.get('dialect', {}).get('annotations', True))
+        results = [(name, segment) for segment, name in _YIELD.findall(script)] or [('_result', script)]
+        body = ''.join(self._result(name, segment, annotations) for name, segment in results).encode()
+        self._reply(body, 'text/csv; charset=utf-8', length)
+
+    def _result(self, name, segment, annotations=True):
+        """One table per field the segment filters for"""
+        recording = self.options.influx_dir and os.path.join(self.options.influx_dir, f"{name}.csv")
+        if recording and os.path.exists(recording):
+            with open(recording) as f:
+                lines = f.read().replace(',_result,', f',{name},').rstrip('\r\n').splitlines()
+            if not annotations:
+                lines = [line for line in lines if not line.startswith('#')]
+            return '\r\n'.join(lines) + '\r\n\r\n'
+
+        projected = segment.rstrip().rstrip('|>').rstrip().endswith(_KEEP_VALUE)
+        start = _START.search(segment)
+        start = start.group(1).strip() if start else None
+        if start and start.isdigit():
+            start = 'day' if time.time() - int(start) <= 86400 else 'year'
+        fields = sorted(set(_FIELD.findall(segment))) or ['Value']
+
+        columns = [c for c in _COLUMNS if not projected or c[0] in ('result', 'table', '_field', '_value')]
+        lines = []
+        if annotations:
+            for i, annotation in enumerate(('#datatype', '#group', '#default'), 1):
+                lines.append(','.join([annotation] + [c[i] for c in columns]))
+        lines.append(','.join([''] + [c[0] for c in columns]))
+        for table, field in enumerate(fields):
+            value = next((v for k, v in CANNED_COUNTERS.items() if name.endswith(k)), None)
+            if value is None:
+                value = CANNED_FIELDS.get((field, start), 1.0)
+            if self.options.vary:
+                # Make every frame differ from the last one
+                value += 100 * self.stats.requests
+            cells = {
+                'result': name, 'table': str(table), '_start': '2025-05-31T12:00:00Z',
+                '_stop': '2025-06-01T12:00:00Z', '_time': '2025-06-01T11:59:00Z', '_value': str(value),
+                '_field': field, '_measurement': 'powerflow',
+            }
+            row = ','.join([''] + [cells[c[0]] for c in columns])
+            lines.extend([row] * self.options.rows)
+        return '\r\n'.join(lines) + '\r\n\r\n'
+
+
+class FroniusHandler(StandInHandler):
+    def do_GET(self):
+        if self.path.startswith('/stats'):
+            self._stats()
+            return
+        if self.path.startswith('/solar_api/v1/GetMeterRealtimeData'):
+            body = json.dumps(CANNED_METER, indent=2).encode()
+        elif self.options.fronius_file:
+            with open(self.options.fronius_file, 'rb') as f:
+                body = f.read()
+        else:
+            doc = json.loads(json.dumps(CANNED_FRONIUS))
+            # Hybrid systems report many more devices
+            inverters = doc['Body']['Data']['Inverters']
+            for i in range(2, 2 + self.options.devices):
+                inverters[str(i)] = dict(inverters['1'])
+            body = json.dumps(doc, indent=2).encode()
+        self._reply(body, 'application/json')
+
+
+def serve(options):
+    """Run both stand-ins, print their ports, serve until stdin closes"""
+    servers = []
+    for handler in (InfluxHandler, FroniusHandler):
+        handler.options = options
+        handler.stats = Stats()
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    print(json.dumps([s.server_port for s in servers]), flush=True)
+    sys.stdin.read()
+
+
+class Phases:
+    """Accumulated wall time per phase"""
+
+    def __init__(self):
+        self.totals = {}
+
+    def add(self, phase, seconds):
+        self.totals[phase] = self.totals.get(phase, 0.0) + seconds
+
+    def wrap(self, phase, func):
+        def timed(*args, **kwargs):
+            t = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(phase, time.perf_counter() - t)
+        return timed
+
+
+def _get(url, method='GET'):
+    from urllib.request import Request, urlopen
+    with urlopen(Request(url, method=method)) as response:
+        return json.loads(response.read())
+
+
+def query_sizes(influx_url, queries):
+    """Response bytes of every query as annotated CSV, in the compact form and gzipped"""
+    from urllib.request import Request, urlopen
+    from influx_api import project, query_body
+
+    sizes = {}
+    for key, query in queries.items():
+        sizes[key] = []
+        for compact, encoding in ((False, 'identity'), (True, 'identity'), (True, 'gzip')):
+            script = f'{project(query, compact)}\n  |> yield(name: "{key}")'
+            body, content_type = query_body(script, compact)
+            request = Request(f'{influx_url}/api/v2/query?org=bench', data=body.encode(),
+                              headers={'Content-Type': content_type, 'Accept-Encoding': encoding})
+            with urlopen(request) as response:
+                sizes[key].append(len(response.read()))
+    return sizes
+
+
+def bench(options):
+    child = subprocess.Popen(
+        [sys.executable, __file__, '--serve'] + sys.argv[1:],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    try:
+        influx_port, fronius_port = json.loads(child.stdout.readline())
+        influx_url = f'http://127.0.0.1:{influx_port}'
+        fronius_url = f'http://127.0.0.1:{fronius_port}'
+
+        os.environ.update({
+            'INFLUX_URL': influx_url,
+            'INFLUX_ORG': 'bench',
+            'INFLUX_TOKEN': 'bench',
+            'INVERTER_IP': f'127.0.0.1:{fronius_port}',
+        })
+        for setting in options.setting:
+            key, _, value = setting.partition('=')
+            os.environ[key] = value
+
+        import fronius_api
+        import influx_api
+        import code
+        from code import EnergyMonitor, EPaperDisplay
+        from metrics import calendar_starts, plan
+        from framebuffer import FramebufferBackend, load_fonts
+
+        # Time the phases without touching the code under test
+        phases = Phases()
+        for module in (influx_api, fronius_api):
+            module.request = phases.wrap('query', module.request)
+        influx_api.parse_results = phases.wrap('parse', influx_api.parse_results)
+        influx_api.parse_value = phases.wrap('parse', influx_api.parse_value)
+        fronius_api.extract = phases.wrap('parse', fronius_api.extract)
+        EPaperDisplay._show = phases.wrap('render', EPaperDisplay._show)
+        FramebufferBackend.refresh = phases.wrap('refresh', FramebufferBackend.refresh)
+
+        monitor = EnergyMonitor(FramebufferBackend(load_fonts(options.fonts), options.cooldown))
+        monitor.screen = options.screen
+
+        for url in (influx_url, fronius_url):
+            _get(f'{url}/stats', 'DELETE')
+
+        tracemalloc.start()
+        cycles = []
+        if options.use_async:
+            # Phases overlap, only the sums over all cycles are meaningful
+            code.CYCLE_INTERVAL = options.interval
+            t = time.perf_counter()
+            asyncio.run(monitor.run_async(options.cycles))
+            cycles.append((time.perf_counter() - t, dict(phases.totals)))
+        else:
+            for i in range(options.cycles):
+                if i:
+                    time.sleep(options.interval)
+                phases.totals = {}
+                t = time.perf_counter()
+                monitor.step()
+                total = time.perf_counter() - t
+                cycles.append((total, dict(phases.totals)))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        influx, fronius = _get(f'{influx_url}/stats'), _get(f'{fronius_url}/stats')
+        sizes = query_sizes(influx_url, plan(code.METRICS, calendar_starts(code.epoch(), code.now()))[0])
+    finally:
+        child.stdin.close()
+        child.wait()
+
+    report(options, cycles, influx, fronius, peak, monitor.display.backend.refreshes, sizes)
+
+
+def report(options, cycles, influx, fronius, peak, refreshes, sizes):
+    print()
+    print(f"{options.cycles} cycles{' (async, all cycles in one row)' if options.use_async else ''}, "
+          f"screen={options.screen}, latency={options.latency} ms, bandwidth={options.bandwidth or '-'} kbit/s, "
+          f"cooldown={options.cooldown} s, "
+          f"rows={options.rows}, devices={options.devices}")
+    print(f"{'cycle':>5} {'total':>9} {'query':>9} {'parse':>9} {'render':>9} {'refresh':>9}")
+    for i, (total, phase) in enumerate(cycles):
+        times = [total] + [phase.get(k, 0.0) for k in ('query', 'parse', 'render', 'refresh')]
+        print(f"{i:>5} " + " ".join(f"{t * 1000:>9.2f}" for t in times))
+    print(f"(ms)  panel refreshes: {refreshes}")
+    for name, stats in (('influx', influx), ('fronius', fronius)):
+        print(f"{name}: {stats['requests']} requests, {stats['bytes_in']} B sent, "
+              f"{stats['bytes_out']} B received")
+    print(f"peak heap: {peak} B")
+    print()
+    print(f"{'query':<13} {'annotated':>9} {'compact':>9} {'saved':>9} {'gzipped':>9}")
+    for key, (annotated, compact, gzipped) in sizes.items():
+        print(f"{key:<13} {annotated:>9} {compact:>9} {100 * (1 - compact / annotated):>8.0f}% "
+              f"{gzipped:>9}")
+    print("(response bytes per query)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--fonts', default='.', help="directory with the BDF fonts")
+    parser.add_argument('--cycles', type=int, default=5)
+    parser.add_argument('--interval', type=float, default=0.0, help="seconds between cycles")
+    parser.add_argument('--screen', choices=('influx', 'fronius'), default='influx')
+    parser.add_argument('--latency', type=float, default=0.0, help="server latency per request in ms")
+    parser.add_argument('--bandwidth', type=float, default=0.0,
+                        help="emulated link speed in kbit/s, 0 for unlimited")
+    parser.add_argument('--rows', type=int, default=1, help="rows per Influx result table")
+    parser.add_argument('--devices', type=int, default=0, help="extra inverters in the Fronius document")
+    parser.add_argument('--cooldown', type=float, default=0.0, help="emulated panel cooldown in s")
+    parser.add_argument('--vary', action='store_true', help="change Influx values on every request")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="run the pipelined EnergyMonitor.run_async() loop")
+    parser.add_argument('--influx-dir', help="directory with recorded <name>.csv responses")
+    parser.add_argument('--fronius-file', help="recorded GetPowerFlowRealtimeData response")
+    parser.add_argument('--setting', action='append', default=[], metavar='KEY=VALUE',
+                        help="settings.toml override, e.g. HTTP_KEEP_ALIVE=0")
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.serve:
+        serve(options)
+    else:
+        bench(options)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,376 +1,508 @@
 import os
-import board
-import displayio
-import busio
-import fourwire
-import digitalio
 import time
-import gc
-import terminalio
-import time
-import wifi
-import microcontroller
 
-from adafruit_display_text import label
-from adafruit_bitmap_font import bitmap_font
-from adafruit_ssd1680 import SSD1680
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
 
-from network import now
+import hardware
+import telemetry
+from telemetry import span
+from network import now, epoch, setting, mem_free
 from fronius_api import FroniusAPI
 from influx_api import InfluxAPI
+from refresh_policy import RefreshPolicy
+from metric_cache import MetricCache
+from year_counters import YearCounters
+from power_history import PowerHistory
+from sources import MeterCounters, Sources
+from recovery import Recovery
+from metrics import Metric, calendar_starts, plan, resolve, DAY, YEAR, MEAN, LAST, DAILY_MAX_MEAN, INCREASE
+from sleep_scheduler import SleepScheduler
+from snapshot import Snapshot
+from layout import DashboardLayout, PowerFlowLayout, battery_geometry
+
+# Refresh only when the rendered frame changes; the clock and PV power
+# have to move by these amounts (minutes, W) to trigger one on their own
+REFRESH_THRESHOLDS = {
+    'time': setting("REFRESH_CLOCK_MINUTES", 10),
+    'pv_now': setting("REFRESH_PV_WATTS", 50),
+}
+REFRESH_MAX_STALENESS = setting("REFRESH_MAX_STALENESS", 1800)
+
+# Seconds between cycles; the pipelined loop fetches the next frame while
+# the panel cools down (needs the asyncio library on the board)
+CYCLE_INTERVAL = setting("CYCLE_INTERVAL", 1)
+ASYNC_PIPELINE = setting("ASYNC_PIPELINE", False) and asyncio is not None
+
+# One update per wakeup with deep sleep in between instead of the loop;
+# after a failed update the board sleeps DEEP_SLEEP_RETRY seconds
+DEEP_SLEEP = setting("DEEP_SLEEP", False)
+DEEP_SLEEP_RETRY = setting("DEEP_SLEEP_RETRY", 60)
+
+# Every dashboard metric; those sharing a range are read in one query.
+# Day and year totals are calendar totals, like the inverter counts them
+METRICS = {
+    'Batt_MAX': Metric("fronius", "storage", "StateOfCharge_Relative", "-7d", DAILY_MAX_MEAN),
+    'Batt_NOW': Metric("fronius", "storage", "StateOfCharge_Relative", "-1h", LAST),
+    'GridImp_YEAR': Metric("home", "powerflow-calculated", "E_Grid_pos", YEAR, INCREASE, 0.001),
+    'GridImp_DAY': Metric("home", "powerflow-calculated", "E_Grid_pos", DAY, INCREASE, 0.001),
+    'GridExp_YEAR': Metric("home", "powerflow-calculated", "E_Grid_neg", YEAR, INCREASE, 0.001),
+    'GridExp_DAY': Metric("home", "powerflow-calculated", "E_Grid_neg", DAY, INCREASE, 0.001),
+    'PV_YEAR': Metric("home", "powerflow-calculated", "E_PV", YEAR, INCREASE, 0.001),
+    'PV_DAY': Metric("home", "powerflow-calculated", "E_PV", DAY, INCREASE, 0.001),
+    'Load_YEAR': Metric("home", "powerflow-calculated", "E_Load", YEAR, INCREASE, 0.001),
+    'PV_15MIN': Metric("fronius", "powerflow", "P_PV", "-15m", MEAN),
+}
+
+# Seconds until an Influx metric is queried again
+METRIC_TTLS = {
+    'Batt_MAX': 3600,
+    'Batt_NOW': 60,
+    'GridImp_YEAR': 3600,
+    'GridImp_DAY': 300,
+    'GridExp_YEAR': 3600,
+    'GridExp_DAY': 300,
+    'PV_YEAR': 3600,
+    'PV_DAY': 300,
+    'Load_YEAR': 3600,
+    'PV_15MIN': 60,
+}
+
+# Energy counter behind each year total, kept up to date from a checkpoint
+# instead of rescanning the year
+YEAR_FIELDS = {k: m.field for k, m in METRICS.items() if m.start == YEAR}
+INCREMENTAL_YEAR = setting("INFLUX_INCREMENTAL_YEAR", True)
+
+# Hot path timings and heap telemetry, written to TELEMETRY_BUCKET in Influx
+# every TELEMETRY_FLUSH seconds or when the buffer is full; without a
+# bucket they are printed to the serial console as JSON
+TELEMETRY = setting("TELEMETRY", False)
+TELEMETRY_CAPACITY = setting("TELEMETRY_CAPACITY", 64)
+TELEMETRY_FLUSH = setting("TELEMETRY_FLUSH", 300)
+TELEMETRY_BUCKET = setting("TELEMETRY_BUCKET", "")
+
+# Shown at the bottom of the screen while values could not be refreshed
+STALE_MARKER = "(!)"
+
+# Keep the last dashboard values in NVM and show them, marked stale, right
+# after a reset while the live values are fetched
+SNAPSHOT = setting("SNAPSHOT", True)
+
+# Sample the inverter on the LAN for live PV power, state of charge and
+# the PV day and year totals instead of querying them from Influx; Influx
+# takes over when it fails
+FRONIUS_HISTORY = setting("FRONIUS_HISTORY", True)
+# Grid import and export totals from the smart meter counters, once they
+# have been read across midnight (or New Year); not with DEEP_SLEEP, which
+# starts over on every wakeup
+FRONIUS_METER = setting("FRONIUS_METER", True)
 
-# Display pins for Waveshare 2.13inch e-ink (SD1680)
-SPI_CLK = board.IO13
-SPI_MOSI = board.IO14
-CS = board.IO15
-DC = board.IO27
-RST = board.IO26
-BUSY = board.IO25
-
-# Fonts
-# TER_U12N = bitmap_font.load_font("ter-u12n.bdf")
-TER_U12N = terminalio.FONT
-TER_U18N = bitmap_font.load_font("ter-u18n.bdf")
 
 class EPaperDisplay:
-    def __init__(self):
-        # Release any existing displays
-        displayio.release_displays()
-
-        # Initialize SPI
-        self._spi = busio.SPI(clock=SPI_CLK, MOSI=SPI_MOSI)
-
-        # Initialize display (250x122 resolution)
-        self._display_bus = fourwire.FourWire(
-            self._spi,
-            command=DC,
-            chip_select=CS,
-            reset=RST,
-            baudrate=1000000
-        )
-        time.sleep(1)
-
-        print("Initialising display...")
-        self.display = SSD1680(
-            self._display_bus,
-            width=250,
-            height=122,
-            busy_pin=BUSY,
-            highlight_color=0xFF0000,
-            rotation=270,
-            colstart=0,
-        )
+    def __init__(self, backend):
+        # Either the panel (displayio_backend) or a host framebuffer
+        self.backend = backend
+
+        self.policy = RefreshPolicy(REFRESH_THRESHOLDS, REFRESH_MAX_STALENESS)
+
+        self.year = None
+        if INCREMENTAL_YEAR:
+            self.year = YearCounters(YEAR_FIELDS)
+        self.cache = MetricCache(METRIC_TTLS)
 
-        # Create main display group
-        self.splash = displayio.Group()
-        self.display.root_group = self.splash
+        # Screens are built on first use and then kept
+        self._layouts = {}
 
-        # Initialize with clear display
-        # self.clear()
+        # Last good inverter reading, shown marked while the inverter is away
+        self._fronius_data = None
 
     def clear(self):
         """Clear the display"""
-        self.splash = displayio.Group()
-        self.display.root_group = self.splash
-
-        # Create white background
-        color_bitmap = displayio.Bitmap(250, 122, 1)
-        color_palette = displayio.Palette(1)
-        color_palette[0] = 0xFFFFFF  # White
-        bg_sprite = displayio.TileGrid(color_bitmap, pixel_shader=color_palette)
-        self.splash.append(bg_sprite)
-
-        self.display.refresh()
-
-    def _query_influx(self, influx_api):
-        queries = {
-                'Batt_MAX': """
-from(bucket: "fronius")
-  |> range(start: -7d)
-  |> filter(fn: (r) => r["_measurement"] == "storage")
-  |> filter(fn: (r) => r["_field"] == "StateOfCharge_Relative")
-  |> aggregateWindow(every: 1d, fn: max, createEmpty: false)
-  |> mean()
-            """,
-                'Batt_NOW': """
-from(bucket: "fronius")
-  |> range(start: -1h)
-  |> filter(fn: (r) => r["_measurement"] == "storage")
-  |> filter(fn: (r) => r["_field"] == "StateOfCharge_Relative")
-  |> last()
-            """,
-                'GridImp_YEAR': """
-from(bucket: "home")
-  |> range(start: -1y)
-  |> filter(fn: (r) => r["_measurement"] == "powerflow-calculated")
-  |> keep(columns: ["_time", "_field", "_value"])
-  |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
-  |> map(fn: (r) => ({r with _value: r.E_Grid_pos / 1000.0, _field: "Value"}))
-  |> group(columns: ["_field"])
-  |> difference()
-  |> sum()
-            """,
-                'GridImp_DAY': """
-from(bucket: "home")
-  |> range(start: -1d)
-  |> filter(fn: (r) => r["_measurement"] == "powerflow-calculated")
-  |> keep(columns: ["_time", "_field", "_value"])
-  |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
-  |> map(fn: (r) => ({r with _value: r.E_Grid_pos / 1000.0, _field: "Value"}))
-  |> group(columns: ["_field"])
-  |> difference()
-  |> sum()
-            """,
-                'GridExp_YEAR': """
-from(bucket: "home")
-  |> range(start: -1y)
-  |> filter(fn: (r) => r["_measurement"] == "powerflow-calculated")
-  |> keep(columns: ["_time", "_field", "_value"])
-  |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
-  |> map(fn: (r) => ({r with _value: r.E_Grid_neg / 1000.0, _field: "Value"}))
-  |> group(columns: ["_field"])
-  |> difference()
-  |> sum()
-            """,
-                'GridExp_DAY': """
-from(bucket: "home")
-  |> range(start: -1d)
-  |> filter(fn: (r) => r["_measurement"] == "powerflow-calculated")
-  |> keep(columns: ["_time", "_field", "_value"])
-  |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
-  |> map(fn: (r) => ({r with _value: r.E_Grid_neg / 1000.0, _field: "Value"}))
-  |> group(columns: ["_field"])
-  |> difference()
-  |> sum()
-            """,
-                'PV_YEAR': """
-from(bucket: "home")
-  |> range(start: -1y)
-  |> filter(fn: (r) => r["_measurement"] == "powerflow-calculated")
-  |> keep(columns: ["_time", "_field", "_value"])
-  |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
-  |> map(fn: (r) => ({r with _value: r.E_PV / 1000.0, _field: "Value"}))
-  |> group(columns: ["_field"])
-  |> difference()
-  |> sum()
-            """,
-                'PV_DAY': """
-from(bucket: "home")
-  |> range(start: -1d)
-  |> filter(fn: (r) => r["_measurement"] == "powerflow-calculated")
-  |> keep(columns: ["_time", "_field", "_value"])
-  |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
-  |> map(fn: (r) => ({r with _value: r.E_PV / 1000.0, _field: "Value"}))
-  |> group(columns: ["_field"])
-  |> difference()
-  |> sum()
-            """,
-                'Load_YEAR': """
-from(bucket: "home")
-  |> range(start: -1y)
-  |> filter(fn: (r) => r["_measurement"] == "powerflow-calculated")
-  |> keep(columns: ["_time", "_field", "_value"])
-  |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
-  |> map(fn: (r) => ({r with _value: r.E_Load / 1000.0, _field: "Value"}))
-  |> group(columns: ["_field"])
-  |> difference()
-  |> sum()
-            """,
-                'PV_15MIN': """
-from(bucket: "fronius")
-  |> range(start: -15m)
-  |> filter(fn: (r) => r["_measurement"] == "powerflow")
-  |> filter(fn: (r) => r["_field"] == "P_PV")
-  |> mean()
-            """,
-        }
-
-        vals = {k:influx_api.get_point(v) for k, v in queries.items()}
+        self.backend.clear()
+
+    def _query_influx(self, influx_api, history=None, breaker=None, sources=None):
+        """Cached metrics with the due ones refetched
+
+        Metrics served by the local sources are taken from them, only the
+        rest is queried from Influx.
+        """
+        served = ()
+        if sources is not None:
+            self.cache.update(sources.poll())
+            served = sources.served()
+        self._fetch_influx(influx_api, breaker, served)
+        return self._cached_values(history)
+
+    def _fetch_influx(self, influx_api, breaker=None, served=()):
+        """Query the due metrics from Influx into the cache
+
+        Metrics in served come from the local sources and are left out.
+        With a breaker the query is skipped while it backs off, and a
+        failure leaves the cached values in place.
+        """
+        due = [k for k in self.cache.due() if k not in served]
+        if due and (breaker is None or breaker.allow()):
+            print(f"Querying {', '.join(due)}...")
+            due_metrics = {k: METRICS[k] for k in due}
+
+            # Calendar totals need the local time
+            try:
+                t = epoch()
+                calendar = calendar_starts(t, now())
+            except Exception as e:
+                print(f"No time for calendar totals: {e}")
+                calendar = None
+                due_metrics = {k: m for k, m in due_metrics.items() if m.start not in (DAY, YEAR)}
+
+            # Year totals are updated incrementally from a checkpoint
+            year_queries = None
+            if calendar and self.year is not None and any(k in YEAR_FIELDS for k in due):
+                year_queries = self.year.queries(t, calendar[YEAR])
+            if year_queries:
+                for k in YEAR_FIELDS:
+                    due_metrics.pop(k, None)
+
+            queries, names = plan(due_metrics, calendar)
+            keys = list(names)
+            if year_queries:
+                queries.update(year_queries)
+                keys.extend(year_queries)
+            if not queries:
+                return
+            if breaker is None:
+                results = influx_api.get_points(queries, keys)
+            else:
+                results = breaker.call(influx_api.get_points, queries, keys) or {}
+            vals = resolve(results, METRICS, names)
+            if year_queries:
+                # All year totals are updated, only the due ones are taken
+                for k, v in self.year.update(results).items():
+                    if k in due:
+                        vals[k] = v
+            self.cache.update(vals)
+
+    def _cached_values(self, history=None):
+        """Cached metrics, marked stale if any expired, with the sparkline of history"""
+        stale = self.cache.stale()
+        if stale:
+            print(f"Stale: {', '.join(stale)}")
+        vals = self.cache.values()
+        vals['stale'] = bool(stale)
+        if history is not None:
+            vals['sparkline'] = history.sparkline('P_PV', *DashboardLayout.SPARKLINE[2:])
         return vals
 
-    def update_from_fronius(self, fronius_api):
-        print(f"Waiting for display update: {self.display.time_to_refresh}s...")
-        time.sleep(self.display.time_to_refresh + 0.1)
-        print("Updating display...")
-
-        # Clear display group
-        self.splash = displayio.Group()
-        self.display.root_group = self.splash
-
-        # Create white background
-        color_bitmap = displayio.Bitmap(250, 122, 1)
-        color_palette = displayio.Palette(1)
-        color_palette[0] = 0xFFFFFF  # White
-        bg_sprite = displayio.TileGrid(color_bitmap, pixel_shader=color_palette)
-        self.splash.append(bg_sprite)
-
-        # Add text labels
-        x_position = 10
-        y_position = 10
-        line_height_1 = 16
-        line_height_2 = 20
-
-        data = fronius_api.get_current_data()
-        data['P_Load'] = (data['P_Grid'] + data['P_Akku'] + data['P_PV'])
+    def _wait_for_refresh(self):
+        """Sleep through the panel cooldown, True if there was one"""
+        if self.backend.time_to_refresh > 0:
+            print(f"Waiting for display update: {self.backend.time_to_refresh}s...")
+            time.sleep(self.backend.time_to_refresh + 0.1)
+            return True
+        return False
 
+    def _clock(self, view, values, fmt, at=None):
+        try:
+            n = now() if at is None else at
+            view['time'] = fmt(n)
+            values['time'] = n.hour * 60 + n.minute
+        except:
+            view['time'] = "Offline"
+
+    def _fronius_view(self, data):
+        """Formatted text and raw values for the power flow screen"""
+        view = {}
+        values = {}
+        if data is None and self._fronius_data is not None:
+            # Last known values, marked as such
+            data = self._fronius_data
+            view['stale'] = STALE_MARKER
+        elif data is not None:
+            self._fronius_data = data
         if data is None:
-            self._add_text("Failed to get data...", x_position, y_position, font=TER_U18N)
-            y_position += line_height_2
+            view['P_PV'] = "Failed to get data..."
         else:
+            data['P_Load'] = (data['P_Grid'] + data['P_Akku'] + data['P_PV'])
             for v, k in [('PV:', 'P_PV'), ('Netz:', 'P_Grid'), ('Last:', 'P_Load')]:
-                self._add_text(f"{v:<5} {(data[k]/1000.0):6.3f} kW", x_position, y_position, font=TER_U18N)
-                y_position += line_height_2
-
+                view[k] = f"{v:<5} {(data[k]/1000.0):6.3f} kW"
             for v, k in [('Akku:', 'SOC'), ('Autarkie:', 'Autonomy')]:
-                self._add_text(f"{v:<10} {data[k]:3.0f} %", x_position, y_position, font=TER_U12N)
-                y_position += line_height_1
-
-        n = now()
-        self._add_text(str(n), 120, 110, font=TER_U12N)
-        y_position += line_height_1
-
-        # Refresh
-        self.display.refresh()
-
-
+                view[k] = f"{v:<10} {data[k]:3.0f} %"
+        self._clock(view, values, lambda n: f"{n.year}-{n.month:02}-{n.day:02} {n.hour:02}:{n.minute:02}")
+        return view, values
 
-    def update_from_influx(self, influx_api):
-        print(f"Waiting for display update: {self.display.time_to_refresh}s...")
-        time.sleep(self.display.time_to_refresh + 0.1)
-
-        print("Querying...")
-        vals = self._query_influx(influx_api)
-
-        print("Updating display...")
+    def update_from_fronius(self, fronius_api):
+        self.render_fronius(fronius_api.get_current_data())
 
-        # Clear display group
-        self.splash = displayio.Group()
-        self.display.root_group = self.splash
+    def fronius_frame(self, data):
+        """Frame for the power flow screen, None if nothing visible changed"""
+        return self._frame(PowerFlowLayout, *self._fronius_view(data),
+                           rebuild=lambda: self._fronius_view(data))
 
-        # Create white background
-        color_bitmap = displayio.Bitmap(250, 122, 1)
-        color_palette = displayio.Palette(1)
-        color_palette[0] = 0xFFFFFF  # White
-        bg_sprite = displayio.TileGrid(color_bitmap, pixel_shader=color_palette)
-        self.splash.append(bg_sprite)
+    def render_fronius(self, data):
+        self.render(self.fronius_frame(data))
 
-        # PV values top left
+    def _influx_view(self, vals):
+        """Formatted text and raw values for the dashboard screen"""
         pv_now = vals.get('PV_15MIN', 0)
-        self._add_text(f"PV: {pv_now:.0f} W", 10, 10, font=TER_U12N, anchor_point=(0, 0))
-
-        # Autonomy top right
         autonomy = 100. * (1. + vals.get('GridImp_YEAR', 0) / vals.get('Load_YEAR', 1))
-        self._add_text(f"Aut.: {autonomy:.0f}%", 240, 10, font=TER_U12N, anchor_point=(1.0, 0))
-
-        # PV values top
-        pv_day = vals.get('PV_DAY', 0)
-        pv_year = vals.get('PV_YEAR', 0)
-        self._add_text("PV", 125, 3, font=TER_U12N, anchor_point=(0.5, 0))
-        self._add_text(f"{pv_day:.0f}", 122, 15, font=TER_U18N, anchor_point=(1, 0))
-        self._add_text(f"{pv_year:.0f}", 122, 33, font=TER_U12N, anchor_point=(1, 0))
-        self._add_text(f"kWh", 128, 31, font=TER_U18N, anchor_point=(0, 0.5))
-
-        # Grid import on left
-        imp_day = vals.get('GridImp_DAY', 0)
-        imp_year = vals.get('GridImp_YEAR', 0)
-        self._add_text("Import", 10, 48, font=TER_U12N)
-        self._add_text(f"{imp_day:.0f}", 40, 60, font=TER_U18N, anchor_point=(1, 0))
-        self._add_text(f"{imp_year:.0f}", 40, 78, font=TER_U12N, anchor_point=(1, 0))
-        self._add_text(f"kWh", 46, 76, font=TER_U18N, anchor_point=(0, 0.5))
-
-        # Grid export on right
-        exp_day = vals.get('GridExp_DAY', 0)
-        exp_year = vals.get('GridExp_YEAR', 0)
-        self._add_text("Export", 240, 48, font=TER_U12N, anchor_point=(1, 0))
-        self._add_text(f"{exp_day:.0f}", 210, 60, font=TER_U18N, anchor_point=(1, 0))
-        self._add_text(f"{exp_year:.0f}", 210, 78, font=TER_U12N, anchor_point=(1, 0))
-        self._add_text(f"kWh", 216, 76, font=TER_U18N, anchor_point=(0, 0.5))
-
-        # Battery bar at bottom
         batt_now = vals.get('Batt_NOW', 0)
         batt_max = vals.get('Batt_MAX', 0)
-        self._draw_battery_bar(125 - 6, 54, batt_now, batt_max, width=12, height=40)
 
-        # Time at bottom center
-        try:
-            n = now()
-            self._add_text(f"{n.day:02}.{n.month:02}.{n.year} {n.hour:02}:{n.minute:02}", 125, 122, font=TER_U12N, anchor_point=(0.5, 1.0))
-        except:
-            self._add_text(f"Offline", 125, 122, font=TER_U12N, anchor_point=(0.5, 1.0))
-
-        # Refresh
-        self.display.refresh()
-
-        # GC
-        self.splash = displayio.Group()
-        self.display.root_group = self.splash
-
-    def _add_text(self, text, x, y, font=TER_U12N, anchor_point=(0, 0)):
-        """Add text label to display"""
-        text_area = label.Label(font, text=text, color=0x0, anchor_point=anchor_point)
-        text_area.x = x
-        text_area.y = y
-        text_area.anchored_position = (x, y)
-        self.splash.append(text_area)
-
-    def _draw_battery_bar(self, x, y, current_value, max_value, width=10, height=40):
-        """Draw vertical battery bar with black outline and filled current value"""
-        # Ensure current value is within bounds
-        current_value = max(0, min(100, current_value))
-
-        # Create battery outline (black border)
-        outline_bitmap = displayio.Bitmap(width, height, 1)
-        outline_palette = displayio.Palette(2)
-        outline_palette[0] = 0xFFFFFF  # White (transparent)
-        outline_palette[1] = 0x000000  # Black border
-
-        # Draw border pixels (top, bottom, left, right)
-        for i in range(width):
-            outline_bitmap[i, 0] = 1  # Top border
-            outline_bitmap[i, height-1] = 1  # Bottom border
-        for i in range(height):
-            outline_bitmap[0, i] = 1  # Left border
-            outline_bitmap[width-1, i] = 1  # Right border
-
-        outline_sprite = displayio.TileGrid(outline_bitmap, pixel_shader=outline_palette, x=x, y=y)
-        self.splash.append(outline_sprite)
-
-        # Draw filled portion for current value
-        if current_value > 0:
-            fill_height = int((current_value / 100.0) * (height - 2))  # Leave space for borders
-            fill_height = max(0, min(fill_height, height - 2))
-
-            if fill_height > 0:
-                fill_bitmap = displayio.Bitmap(width - 2, fill_height, 1)
-                fill_palette = displayio.Palette(1)
-                fill_palette[0] = 0x000000  # Black fill
-
-                # Position fill from bottom up
-                fill_y = y + height - 1 - fill_height
-                fill_sprite = displayio.TileGrid(fill_bitmap, pixel_shader=fill_palette, x=x + 1, y=fill_y)
-                self.splash.append(fill_sprite)
-
-
-        # Draw max line
-        max_bitmap = displayio.Bitmap(width + 2, 1, 1)
-        max_palette = displayio.Palette(1)
-        max_palette[0] = 0x000000  # Black fill
-        max_y = y + height - 1 - int((max_value / 100.0) * (height - 2))
-        max_sprite = displayio.TileGrid(max_bitmap, pixel_shader=max_palette, x=x - 1, y=max_y)
-        self.splash.append(max_sprite)
+        view = {
+            'pv_now': f"PV: {pv_now:.0f} W",
+            'autonomy': f"Aut.: {autonomy:.0f}%",
+            'pv_day': f"{vals.get('PV_DAY', 0):.0f}",
+            'pv_year': f"{vals.get('PV_YEAR', 0):.0f}",
+            'imp_day': f"{vals.get('GridImp_DAY', 0):.0f}",
+            'imp_year': f"{vals.get('GridImp_YEAR', 0):.0f}",
+            'exp_day': f"{vals.get('GridExp_DAY', 0):.0f}",
+            'exp_year': f"{vals.get('GridExp_YEAR', 0):.0f}",
+            'stale': STALE_MARKER if vals.get('stale') else "",
+            # Only the pixel geometry of the bar is visible
+            'battery': "%d,%d" % battery_geometry(batt_now, batt_max, DashboardLayout.BATTERY[3]),
+        }
+        values = {
+            'pv_now': pv_now,
+            'batt_now': batt_now,
+            'batt_max': batt_max,
+            # Not part of the view: PV power and its threshold decide refreshes
+            'sparkline': vals.get('sparkline', ()),
+        }
+        self._clock(view, values, lambda n: f"{n.day:02}.{n.month:02}.{n.year} {n.hour:02}:{n.minute:02}",
+                    vals.get('time'))
+        return view, values
+
+    def update_from_influx(self, influx_api, history=None, breaker=None, sources=None):
+        self.render_influx(self._query_influx(influx_api, history, breaker, sources))
+
+    def influx_frame(self, vals):
+        """Frame for the dashboard screen, None if nothing visible changed"""
+        rebuild = None
+        if 'time' not in vals:
+            # Unless pinned to the time of a snapshot
+            rebuild = lambda: self._influx_view(self._recached(vals))
+        return self._frame(DashboardLayout, *self._influx_view(vals), rebuild=rebuild)
+
+    def _recached(self, vals):
+        """vals with the metrics read from the cache again, where it has them"""
+        cached = self.cache.values()
+        if not cached:
+            return vals
+        vals = dict(vals)
+        vals.update(cached)
+        vals['stale'] = bool(self.cache.stale())
+        return vals
+
+    def render_influx(self, vals):
+        self.render(self.influx_frame(vals))
+
+    def _frame(self, layout_class, view, values, rebuild=None):
+        """(layout_class, view, values, rebuild), None if nothing visible changed
+
+        rebuild() returns view and values again, e.g. with the clock of the
+        moment the frame is shown after the panel cooldown.
+        """
+        if not self.policy.should_refresh(view, values):
+            print("No visible change, skipping refresh")
+            return None
+        return layout_class, view, values, rebuild
+
+    def render(self, frame):
+        """Wait for the panel to accept a refresh, then show frame"""
+        if frame is not None:
+            waited = self._wait_for_refresh()
+            print("Updating display...")
+            self._show(*_current(frame, waited))
+
+    async def render_async(self, frame):
+        """Like render(), but other tasks keep running during the cooldown"""
+        if frame is not None:
+            waited = self.backend.time_to_refresh > 0
+            if waited:
+                print(f"Waiting for display update: {self.backend.time_to_refresh}s...")
+                await asyncio.sleep(self.backend.time_to_refresh + 0.1)
+            print("Updating display...")
+            self._show(*_current(frame, waited))
+
+    def _show(self, layout_class, view, values):
+        """Update the retained layout in place and refresh the panel"""
+        layout = self._layouts.get(layout_class)
+        if layout is None:
+            layout = self._layouts[layout_class] = layout_class(self.backend)
+        self.backend.show(layout.screen)
+
+        with span('render'):
+            layout.update(view, values)
+        with span('refresh'):
+            self.backend.refresh()
+        self.policy.mark_refreshed(view, values)
 
 
 class EnergyMonitor:
-    def __init__(self):
+    def __init__(self, backend=None):
         self.fronius_api = FroniusAPI(os.getenv("INVERTER_IP"))
         self.influx_api = InfluxAPI(
             os.getenv("INFLUX_URL"),
             os.getenv("INFLUX_ORG"),
             os.getenv("INFLUX_TOKEN")
         )
-        self.display = EPaperDisplay()
+        if backend is None:
+            from displayio_backend import DisplayioBackend
+            backend = DisplayioBackend()
+        self.display = EPaperDisplay(backend)
+        self.recovery = Recovery()
+        self.history = None
+        local = []
+        if FRONIUS_HISTORY:
+            self.history = PowerHistory(self.fronius_api, self.recovery.fronius)
+            local.append(self.history)
+        if FRONIUS_METER and not DEEP_SLEEP:
+            local.append(MeterCounters(self.fronius_api, self.recovery.fronius))
+        self.sources = Sources(local)
+
+        self.snapshot = None
+        if SNAPSHOT:
+            self.snapshot = Snapshot(self.display)
+
+        if TELEMETRY:
+            telemetry.enable(TELEMETRY_CAPACITY)
+        self._flushed_at = time.monotonic()
+
+        # 'influx' dashboard or 'fronius' live power flow
+        self.screen = setting("SCREEN", "influx")
+
+    def step(self):
+        """One cycle of the main loop"""
+        # Layouts are retained, no per-frame garbage to collect
+        _print_memory()
+
+        # Update display
+        if self.screen == 'fronius':
+            self.display.render_fronius(self._fronius_data())
+        else:
+            self.display.render_influx(self._influx_data())
+            self.save_snapshot()
+        self.flush_telemetry()
+
+    def first_paint(self):
+        """Show the snapshot until live values arrive, True if there was one
+
+        Not after a timed wakeup: the panel still shows the last frame.
+        """
+        if self.snapshot is None or self.screen != 'influx' or hardware.woke_from_alarm():
+            return False
+        # A bad record must not keep the monitor from starting
+        try:
+            return self.snapshot.paint()
+        except Exception as e:
+            print(f"Failed to paint the snapshot: {e}")
+            return False
+
+    def save_snapshot(self):
+        if self.snapshot is not None and self.screen == 'influx':
+            self.snapshot.save()
+
+    def flush_telemetry(self, force=False):
+        """Pass buffered telemetry on once the buffer is full or TELEMETRY_FLUSH passed"""
+        if not telemetry.pending():
+            return
+        t = time.monotonic()
+        if not force and telemetry.pending() < TELEMETRY_CAPACITY and t - self._flushed_at < TELEMETRY_FLUSH:
+            return
+        self._flushed_at = t
+
+        if not TELEMETRY_BUCKET:
+            telemetry.dump()
+        else:
+            try:
+                if not self.influx_api.write(TELEMETRY_BUCKET, list(telemetry.lines(epoch()))):
+                    return
+            except Exception as e:
+                print(f"Failed to write telemetry: {e}")
+                return
+        telemetry.clear()
+
+    async def _fetch(self, not_before):
+        """Data for the next frame, all sources of the screen at once"""
+        delay = not_before - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if self.screen == 'fronius':
+            data, = await _gather(self._fronius_data)
+            return data
+        # The inverter on the LAN and Influx are asked at the same time.
+        # Influx is not asked for what the inverter served last time, and
+        # what it serves now takes precedence
+        served = self.sources.served()
+        local, _ = await _gather(self.sources.poll, lambda: self._fetch_influx(served))
+        self.display.cache.update(local)
+        return self.display._cached_values(self.history)
+
+    def _influx_data(self):
+        if self.snapshot is not None:
+            self.snapshot.restore()
+        return self.display._query_influx(
+            self.influx_api, self.history, self.recovery.influx, self.sources)
+
+    def _fetch_influx(self, served=()):
+        if self.snapshot is not None:
+            self.snapshot.restore()
+        self.display._fetch_influx(self.influx_api, self.recovery.influx, served)
+
+    def _fronius_data(self):
+        return self.recovery.fronius.call(self.fronius_api.get_current_data)
+
+    def _frame(self, data):
+        if self.screen == 'fronius':
+            return self.display.fronius_frame(data)
+        return self.display.influx_frame(data)
+
+    async def run_async(self, cycles=None):
+        """Pipelined main loop
+
+        Data for the next frame is fetched while the current one waits for
+        the panel cooldown and is rendered, so a cycle takes about as long
+        as its slowest stage.
+        """
+        start = time.monotonic()
+        fetch = asyncio.create_task(self._fetch(start))
+        cycle = 0
+        while cycles is None or cycle < cycles:
+            data = await fetch
+            cycle += 1
+            _print_memory()
+
+            # Start on the next frame right away, fetches at most once per interval
+            if cycles is None or cycle < cycles:
+                start = max(start + CYCLE_INTERVAL, time.monotonic())
+                fetch = asyncio.create_task(self._fetch(start))
+            await self.display.render_async(self._frame(data))
+            self.save_snapshot()
+            self.flush_telemetry()
+
+    def run_deep_sleep(self):
+        """Update once with the state kept in sleep memory, then deep sleep"""
+        scheduler = SleepScheduler(self.display)
+        if scheduler.restore():
+            print("Restored state from sleep memory")
+        try:
+            self.step()
+        except Exception as e:
+            print(f"Error in update: {e}")
+            scheduler.sleep(DEEP_SLEEP_RETRY)
+        # The buffer does not survive deep sleep
+        self.flush_telemetry(force=True)
+        scheduler.sleep()
 
     def run(self):
+        self.first_paint()
+
+        if DEEP_SLEEP:
+            self.run_deep_sleep()
+            return
+
         # Test connection to inverter
         # if not self.fronius_api.test_connection():
         #     print("Warning: Could not connect to inverter. Check IP address and network.")
@@ -379,25 +511,55 @@ class EnergyMonitor:
 
         while True:
             try:
-                # Prevent tight loop
-                time.sleep(1)
+                if ASYNC_PIPELINE:
+                    asyncio.run(self.run_async())
 
-                # GC
-                print("Collecting garbage...")
-                gc.collect()
-                print(f"Memory: {gc.mem_free()}b")
+                # Prevent tight loop
+                time.sleep(CYCLE_INTERVAL)
 
-                # Update display
-                self.display.update_from_influx(self.influx_api)
-                # self.display.update_from_fronius(self.fronius_api)
+                self.step()
+                self.recovery.ok()
 
             except KeyboardInterrupt:
                 print("Shutting down...")
                 break
             except Exception as e:
                 print(f"Error in main loop: {e}")
-                time.sleep(5)
-                microcontroller.reset()
+                if not hardware.ON_BOARD:
+                    raise
+                # Failed requests escalate through the breakers, anything
+                # else carries on after a backoff unless the heap is the problem
+                self.recovery.error()
+
+
+def _print_memory():
+    """Free heap, left out where the runtime cannot tell"""
+    free = mem_free()
+    if free is not None:
+        print(f"Memory: {free}b")
+
+
+def _current(frame, waited):
+    """layout_class, view and values of frame, rebuilt if it waited for the panel"""
+    layout_class, view, values, rebuild = frame
+    if waited and rebuild is not None:
+        view, values = rebuild()
+    return layout_class, view, values
+
+
+async def _blocking(func):
+    """Run a blocking call, in a worker thread where the runtime has them"""
+    to_thread = getattr(asyncio, 'to_thread', None)
+    if to_thread is None:
+        await asyncio.sleep(0)
+        return func()
+    return await to_thread(func)
+
+
+async def _gather(*funcs):
+    """Run blocking calls concurrently where possible, return their results"""
+    return await asyncio.gather(*(_blocking(func) for func in funcs))
+
 
 if __name__ == "__main__":
     monitor = EnergyMonitor()
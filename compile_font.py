@@ -0,0 +1,90 @@
+"""Compile a BDF font into a glyph-subset .glf font for the board
+
+    python compile_font.py ter-u18n.bdf ter-u18n.glf
+    python compile_font.py ter-u18n.bdf ter-u18n.glf --measure
+
+Only the glyphs the layouts draw with the font are kept (--chars to
+override). --measure compares loading the sample glyphs on the host
+with adafruit_bitmap_font from the BDF, as the board does without a
+.glf file, and with GlyphFont from the .glf file: time, file size and
+memory. Both build displayio bitmaps, which takes Blinka's displayio on
+the host. import_report.py measures the same on the board.
+"""
+import argparse
+import os
+import struct
+import time
+import tracemalloc
+
+from framebuffer import BDFFont
+from glyph_font import GlyphFont, MAGIC, HEADER, ENTRY
+
+# Everything the layouts draw in the large font: day totals with "kWh"
+# and the power flow lines, e.g. "Netz: -0.800 kW" or "Failed to get data..."
+LARGE_CHARS = "0123456789 .-:kWh" + "PV:Netz:Last:" + "Failed to get data..."
+
+SAMPLE_TEXTS = ("21", "kWh", "PV:    3.456 kW", "Netz: -0.800 kW", "Last:  1.456 kW")
+
+
+def compile_font(bdf_path, glf_path, chars=LARGE_CHARS):
+    """Write the glyphs for chars of the BDF font to glf_path, return the glyph count"""
+    font = BDFFont(bdf_path)
+    codes = sorted(c for c in set(ord(ch) for ch in chars) if c in font.glyphs)
+
+    index = bytearray()
+    bitmaps = bytearray()
+    start = struct.calcsize(HEADER) + len(codes) * struct.calcsize(ENTRY)
+    for code in codes:
+        g = font.glyphs[code]
+        index.extend(struct.pack(ENTRY, code, g.width, g.height, g.dx, g.dy, g.shift_x,
+                                 start + len(bitmaps)))
+        row_bytes = (g.width + 7) // 8
+        for bits in g.rows:
+            bitmaps.extend((bits << (row_bytes * 8 - g.width)).to_bytes(row_bytes, 'big'))
+
+    with open(glf_path, 'wb') as f:
+        f.write(struct.pack(HEADER, MAGIC, len(codes), *font.bounding_box,
+                            font.ascent, font.descent))
+        f.write(index)
+        f.write(bitmaps)
+    return len(codes)
+
+
+def measure(name, load, path):
+    tracemalloc.start()
+    t = time.perf_counter()
+    font = load(path)
+    opened = time.perf_counter() - t
+    font.load_glyphs(''.join(SAMPLE_TEXTS))
+    for text in SAMPLE_TEXTS:
+        for ch in text:
+            font.get_glyph(ord(ch))
+    total = time.perf_counter() - t
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name}: {os.path.getsize(path)} bytes, open {opened * 1000:.2f} ms, "
+          f"open + sample glyphs {total * 1000:.2f} ms, "
+          f"retained {retained} bytes, peak {peak} bytes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('bdf', help="source BDF font")
+    parser.add_argument('glf', help="output glyph font")
+    parser.add_argument('--chars', default=LARGE_CHARS, help="characters to keep")
+    parser.add_argument('--measure', action='store_true', help="compare BDF and glyph font loading")
+    args = parser.parse_args()
+
+    count = compile_font(args.bdf, args.glf, args.chars)
+    print(f"{args.glf}: {count} glyphs")
+    if args.measure:
+        try:
+            from adafruit_bitmap_font import bitmap_font
+        except ImportError:
+            parser.error("--measure needs adafruit-circuitpython-bitmap-font")
+        measure("BDF", bitmap_font.load_font, args.bdf)
+        measure("GLF", GlyphFont, args.glf)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Screen widgets drawn into one shared canvas
+
+Instead of a displayio object per label or bar, every widget of the shown
+screen is drawn into a single bitmap when the screen is refreshed. A
+canvas provides fill_rect(x1, y1, x2, y2, value) and blit_glyph(glyph, x,
+y); TextLabel places glyphs like adafruit_display_text.label.Label.
+"""
+from layout import WIDTH, HEIGHT, battery_geometry
+
+WHITE = 0
+BLACK = 1
+
+
+class TextLabel:
+    """Single-line label placed like adafruit_display_text.label.Label"""
+
+    def __init__(self, font, text, x, y, anchor_point):
+        self.font = font
+        self.text = text
+        self.anchored_position = (x, y)
+        self.anchor_point = anchor_point
+        self._y_offset = _ascent(font) // 2
+
+    def draw(self, canvas):
+        font = self.font
+        y_offset = self._y_offset
+
+        # Bounding box and glyph positions relative to the label origin
+        x = top = bottom = right = 0
+        placed = []
+        for character in self.text:
+            glyph = font.get_glyph(ord(character))
+            if not glyph:
+                continue
+            bottom = max(bottom, -glyph.dy + y_offset)
+            top = min(top, -glyph.height - glyph.dy + y_offset)
+            right = max(right, x + glyph.shift_x, x + glyph.width + glyph.dx)
+            placed.append((x + glyph.dx, -glyph.height - glyph.dy + y_offset, glyph))
+            x += glyph.shift_x
+
+        ax, ay = self.anchor_point
+        px, py = self.anchored_position
+        origin_x = int(px - round(ax * right))
+        origin_y = int(py - top - round(ay * (bottom - top)))
+
+        for gx, gy, glyph in placed:
+            canvas.blit_glyph(glyph, origin_x + gx, origin_y + gy)
+
+
+class BatteryBar:
+    """Vertical battery bar with black outline, fill level and max line"""
+
+    def __init__(self, x, y, width=10, height=40):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.current_value = 0
+        self.max_value = 0
+
+    def update(self, current_value, max_value):
+        self.current_value = current_value
+        self.max_value = max_value
+
+    def draw(self, canvas):
+        x, y, w, h = self.x, self.y, self.width, self.height
+        fill_height, max_y = battery_geometry(self.current_value, self.max_value, h)
+
+        canvas.fill_rect(x, y, x + w, y + 1, BLACK)
+        canvas.fill_rect(x, y + h - 1, x + w, y + h, BLACK)
+        canvas.fill_rect(x, y, x + 1, y + h, BLACK)
+        canvas.fill_rect(x + w - 1, y, x + w, y + h, BLACK)
+        canvas.fill_rect(x + 1, y + h - 1 - fill_height, x + w - 1, y + h - 1, BLACK)
+        canvas.fill_rect(x - 1, y + max_y, x + w + 1, y + max_y + 1, BLACK)
+
+
+class Sparkline:
+    """Column chart of recent samples, right aligned, one pixel column per sample"""
+
+    def __init__(self, x, y, width, height):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.heights = ()
+
+    def update(self, heights):
+        self.heights = heights
+
+    def draw(self, canvas):
+        offset = self.width - len(self.heights)
+        bottom = self.y + self.height
+        for k, h in enumerate(self.heights):
+            x = self.x + offset + k
+            canvas.fill_rect(x, bottom - h, x + 1, bottom, BLACK)
+
+
+def _ascent(font):
+    """Ascent as Label takes it: from the font, else measured on a few glyphs"""
+    ascent = getattr(font, 'ascent', None)
+    if ascent is not None:
+        return ascent
+    ascent = 0
+    for character in "M j'":
+        glyph = font.get_glyph(ord(character))
+        if glyph:
+            ascent = max(ascent, glyph.height + glyph.dy)
+    return ascent
+
+
+class Compositor:
+    """Display backend base drawing the widgets of the shown screen into canvas
+
+    Screens are plain lists of widgets. Subclasses call draw() from
+    refresh() and provide time_to_refresh and clear().
+    """
+
+    def __init__(self, fonts, canvas):
+        self.fonts = fonts
+        self.canvas = canvas
+        self._screen = None
+
+    def screen(self):
+        return []
+
+    def label(self, screen, text, x, y, font, anchor_point):
+        text_area = TextLabel(self.fonts[font], text, x, y, anchor_point)
+        screen.append(text_area)
+        return text_area
+
+    def battery_bar(self, screen, x, y, width, height):
+        bar = BatteryBar(x, y, width, height)
+        screen.append(bar)
+        return bar
+
+    def sparkline(self, screen, x, y, width, height):
+        line = Sparkline(x, y, width, height)
+        screen.append(line)
+        return line
+
+    def show(self, screen):
+        self._screen = screen
+
+    def draw(self):
+        self.canvas.fill_rect(0, 0, WIDTH, HEIGHT, WHITE)
+        for widget in self._screen or ():
+            widget.draw(self.canvas)
@@ -0,0 +1,154 @@
+import time
+
+import board
+import busio
+import displayio
+import fourwire
+import terminalio
+
+from adafruit_ssd1680 import SSD1680
+
+try:
+    import bitmaptools
+except ImportError:
+    bitmaptools = None
+
+from compositor import Compositor
+from glyph_font import GlyphFont
+from layout import WIDTH, HEIGHT
+
+# Display pins for Waveshare 2.13inch e-ink (SD1680)
+SPI_CLK = board.IO13
+SPI_MOSI = board.IO14
+CS = board.IO15
+DC = board.IO27
+RST = board.IO26
+BUSY = board.IO25
+
+# bitmaptools.blit came with CircuitPython 9
+_blit = getattr(bitmaptools, 'blit', None)
+
+
+def load_fonts():
+    # TER_U12N = bitmap_font.load_font("ter-u12n.bdf")
+    return {
+        'small': terminalio.FONT,
+        'large': load_font("ter-u18n"),
+    }
+
+
+def load_font(name):
+    """Compiled glyph subset (compile_font.py) if uploaded, else the BDF file"""
+    try:
+        return GlyphFont(f"{name}.glf")
+    except OSError:
+        from adafruit_bitmap_font import bitmap_font
+        return bitmap_font.load_font(f"{name}.bdf")
+
+
+class DisplayioBackend(Compositor):
+    """SSD1680 e-paper panel driven through displayio
+
+    All widgets are drawn into one shared 1-bit bitmap, shown as the only
+    TileGrid of the root group.
+    """
+
+    def __init__(self, fonts=None):
+        self._bitmap = displayio.Bitmap(WIDTH, HEIGHT, 2)
+        super().__init__(fonts or load_fonts(), BitmapCanvas(self._bitmap))
+
+        # Release any existing displays
+        displayio.release_displays()
+
+        # Initialize SPI
+        self._spi = busio.SPI(clock=SPI_CLK, MOSI=SPI_MOSI)
+
+        # Initialize display (250x122 resolution)
+        self._display_bus = fourwire.FourWire(
+            self._spi,
+            command=DC,
+            chip_select=CS,
+            reset=RST,
+            baudrate=1000000
+        )
+        time.sleep(1)
+
+        print("Initialising display...")
+        self.display = SSD1680(
+            self._display_bus,
+            width=WIDTH,
+            height=HEIGHT,
+            busy_pin=BUSY,
+            highlight_color=0xFF0000,
+            rotation=270,
+            colstart=0,
+        )
+
+        palette = displayio.Palette(2)
+        palette[0] = 0xFFFFFF  # White
+        palette[1] = 0x000000  # Black
+        self.root = displayio.Group()
+        self.root.append(displayio.TileGrid(self._bitmap, pixel_shader=palette))
+        self.display.root_group = self.root
+
+    @property
+    def time_to_refresh(self):
+        return self.display.time_to_refresh
+
+    def refresh(self):
+        self.draw()
+        self.display.refresh()
+
+    def clear(self):
+        """Clear the display"""
+        self._screen = None
+        self.refresh()
+
+
+class BitmapCanvas:
+    """Drawing primitives on a displayio.Bitmap, bitmaptools where available"""
+
+    def __init__(self, bitmap):
+        self.bitmap = bitmap
+        self.width = bitmap.width
+        self.height = bitmap.height
+
+    def fill_rect(self, x1, y1, x2, y2, value):
+        """Fill [x1, x2) x [y1, y2), clipped to the bitmap"""
+        _fill_rect(self.bitmap, max(0, x1), max(0, y1),
+                   min(self.width, x2), min(self.height, y2), value)
+
+    def blit_glyph(self, glyph, x, y, value=1):
+        """Set the inked pixels of a fontio glyph at x, y"""
+        source = glyph.bitmap
+        # Builtin fonts keep all glyphs as tiles of one bitmap
+        per_row = source.width // glyph.width if glyph.width else 1
+        sx = (glyph.tile_index % per_row) * glyph.width
+        sy = (glyph.tile_index // per_row) * glyph.height
+
+        # Clip to the canvas
+        x1, y1 = max(0, -x), max(0, -y)
+        x2 = min(glyph.width, self.width - x)
+        y2 = min(glyph.height, self.height - y)
+        if x1 >= x2 or y1 >= y2:
+            return
+        if _blit is not None and value == 1:
+            _blit(self.bitmap, source, x + x1, y + y1,
+                  x1=sx + x1, y1=sy + y1, x2=sx + x2, y2=sy + y2,
+                  skip_source_index=0)
+        else:
+            for j in range(y1, y2):
+                for i in range(x1, x2):
+                    if source[sx + i, sy + j]:
+                        self.bitmap[x + i, y + j] = value
+
+
+def _fill_rect(bitmap, x1, y1, x2, y2, value):
+    if x1 >= x2 or y1 >= y2:
+        return
+    if bitmaptools is not None:
+        bitmaptools.fill_region(bitmap, x1, y1, x2, y2, value)
+    else:
+        for y in range(y1, y2):
+            for x in range(x1, x2):
+                bitmap[x, y] = value
@@ -0,0 +1,213 @@
+"""Pure-Python display backend for rendering layouts on the host
+
+Draws the same compositor widgets as displayio_backend into a byte per
+pixel buffer, so screens can be rendered, timed and compared without the
+panel.
+"""
+import struct
+import time
+import zlib
+
+from compositor import Compositor, BLACK
+from glyph_font import GlyphFont
+from layout import WIDTH, HEIGHT
+
+RED = 2
+
+# RGB of the three panel colours, indexed by pixel value
+PALETTE = ((0xFF, 0xFF, 0xFF), (0x00, 0x00, 0x00), (0xFF, 0x00, 0x00))
+
+
+class Glyph:
+    """Glyph as fontio describes it, rows hold pixel bits MSB first"""
+
+    def __init__(self, rows, width, height, dx, dy, shift_x):
+        self.rows = rows
+        self.width = width
+        self.height = height
+        self.dx = dx
+        self.dy = dy
+        self.shift_x = shift_x
+
+
+class BDFFont:
+    """Glyphs of a BDF file
+
+    With cell=True every glyph is placed into a fixed cell of the font
+    bounding box with dx = dy = 0, the way CircuitPython bakes ter-u12n.bdf
+    into terminalio.FONT.
+    """
+
+    def __init__(self, path, cell=False):
+        self.glyphs = {}
+        self.ascent = None
+        self.descent = None
+        bbox = None
+        glyph = None
+        rows = None
+
+        with open(path) as f:
+            for line in f:
+                words = line.split()
+                if not words:
+                    continue
+                if words[0] == 'FONTBOUNDINGBOX':
+                    bbox = [int(w) for w in words[1:5]]
+                elif words[0] == 'FONT_ASCENT':
+                    self.ascent = int(words[1])
+                elif words[0] == 'FONT_DESCENT':
+                    self.descent = int(words[1])
+                elif words[0] == 'ENCODING':
+                    glyph = {'code': int(words[1])}
+                elif words[0] == 'DWIDTH' and glyph is not None:
+                    glyph['shift_x'] = int(words[1])
+                elif words[0] == 'BBX' and glyph is not None:
+                    glyph['bbx'] = [int(w) for w in words[1:5]]
+                elif words[0] == 'BITMAP' and glyph is not None:
+                    rows = []
+                elif words[0] == 'ENDCHAR' and glyph is not None:
+                    width, height, dx, dy = glyph['bbx']
+                    # BDF rows are padded to full bytes
+                    pad = (len(rows[0]) * 4 - width) if rows else 0
+                    bits = [int(r, 16) >> pad for r in rows]
+                    self.glyphs[glyph['code']] = Glyph(
+                        bits, width, height, dx, dy, glyph.get('shift_x', width))
+                    glyph = None
+                    rows = None
+                elif rows is not None:
+                    rows.append(words[0])
+
+        self.bounding_box = tuple(bbox)
+        if cell:
+            self._to_cells(*bbox)
+
+    def _to_cells(self, cell_width, cell_height, x_offset, y_offset):
+        baseline = cell_height + y_offset
+        for code, g in self.glyphs.items():
+            rows = [0] * cell_height
+            top = baseline - (g.height + g.dy)
+            for i, bits in enumerate(g.rows):
+                if 0 <= top + i < cell_height:
+                    shift = cell_width - g.dx - g.width
+                    rows[top + i] = bits << shift if shift >= 0 else bits >> -shift
+            self.glyphs[code] = Glyph(rows, cell_width, cell_height, 0, 0, cell_width)
+        # Label measures builtin fonts on their glyphs, all of them are full cells
+        self.ascent = cell_height
+        self.descent = 0
+
+    def get_bounding_box(self):
+        return self.bounding_box
+
+    def get_glyph(self, code_point):
+        return self.glyphs.get(code_point)
+
+
+class FrameBuffer:
+    """WIDTH x HEIGHT three-colour framebuffer, one byte per pixel"""
+
+    def __init__(self, width=WIDTH, height=HEIGHT):
+        self.width = width
+        self.height = height
+        self.pixels = bytearray(width * height)
+
+    def __getitem__(self, xy):
+        x, y = xy
+        return self.pixels[y * self.width + x]
+
+    def __setitem__(self, xy, value):
+        x, y = xy
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.pixels[y * self.width + x] = value
+
+    def fill(self, value):
+        self.pixels[:] = bytes([value]) * len(self.pixels)
+
+    def fill_rect(self, x1, y1, x2, y2, value):
+        """Fill [x1, x2) x [y1, y2), clipped to the buffer"""
+        x1, x2 = max(0, x1), min(self.width, x2)
+        if x1 >= x2:
+            return
+        row = bytes([value]) * (x2 - x1)
+        for y in range(max(0, y1), min(self.height, y2)):
+            start = y * self.width
+            self.pixels[start + x1:start + x2] = row
+
+    def blit_glyph(self, glyph, x, y, value=BLACK):
+        for i, bits in enumerate(glyph.rows):
+            for j in range(glyph.width):
+                if bits & (1 << (glyph.width - 1 - j)):
+                    self[x + j, y + i] = value
+
+    def write_pbm(self, path):
+        """Binary PBM, red counts as black"""
+        row_bytes = (self.width + 7) // 8
+        data = bytearray(row_bytes * self.height)
+        for y in range(self.height):
+            for x in range(self.width):
+                if self.pixels[y * self.width + x]:
+                    data[y * row_bytes + x // 8] |= 0x80 >> (x % 8)
+        with open(path, 'wb') as f:
+            f.write(b'P4\n%d %d\n' % (self.width, self.height))
+            f.write(data)
+
+    def write_png(self, path):
+        """Palette PNG with the three panel colours"""
+        raw = b''.join(
+            b'\x00' + bytes(self.pixels[y * self.width:(y + 1) * self.width])
+            for y in range(self.height)
+        )
+
+        def chunk(kind, data):
+            body = kind + data
+            return struct.pack('>I', len(data)) + body + struct.pack('>I', zlib.crc32(body))
+
+        with open(path, 'wb') as f:
+            f.write(b'\x89PNG\r\n\x1a\n')
+            f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', self.width, self.height, 8, 3, 0, 0, 0)))
+            f.write(chunk(b'PLTE', b''.join(bytes(c) for c in PALETTE)))
+            f.write(chunk(b'IDAT', zlib.compress(raw)))
+            f.write(chunk(b'IEND', b''))
+
+
+class FramebufferBackend(Compositor):
+    """Display backend rendering into a FrameBuffer instead of the panel
+
+    refresh() rasterises the shown screen; refreshes counts them. cooldown
+    emulates the minimum time the panel needs between refreshes.
+    """
+
+    def __init__(self, fonts, cooldown=0):
+        self.fb = FrameBuffer()
+        super().__init__(fonts, self.fb)
+        self.refreshes = 0
+        self.cooldown = cooldown
+        self._ready_at = 0
+
+    @property
+    def time_to_refresh(self):
+        return max(0, self._ready_at - time.monotonic())
+
+    def refresh(self):
+        self.draw()
+        self.refreshes += 1
+        self._ready_at = time.monotonic() + self.cooldown
+
+    def clear(self):
+        self._screen = None
+        self.refresh()
+
+
+def load_fonts(directory='.', compiled=False):
+    """Host equivalents of displayio_backend.load_fonts()
+
+    compiled=True takes the large font from ter-u18n.glf like the board
+    does when it has been uploaded.
+    """
+    if compiled:
+        large = GlyphFont(f"{directory}/ter-u18n.glf", bitmap=None)
+    else:
+        large = BDFFont(f"{directory}/ter-u18n.bdf")
+    return {
+        'small': BDFFont(f"{directory}/ter-u12n.bdf", cell=True),
+        'large': large,
+    }
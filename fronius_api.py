@@ -1,22 +1,53 @@
 import json
 import time
 
-from network import requests
+from network import ACCEPT_ENCODING, request, iter_content
+from json_stream import extract
+from telemetry import span
+
+# Power flow values and where they live in GetPowerFlowRealtimeData
+POWER_FLOW_FIELDS = {
+    'P_PV': 'Body.Data.Site.P_PV',
+    'P_Akku': 'Body.Data.Site.P_Akku',
+    'P_Grid': 'Body.Data.Site.P_Grid',
+    'SOC': 'Body.Data.Inverters.1.SOC',
+    'Autonomy': 'Body.Data.Site.rel_Autonomy',
+    'timestamp': 'Head.Timestamp',
+    # Energy produced (Wh) in the calendar day and year; null where the
+    # inverter does not count it (e.g. on GEN24)
+    'E_Day': 'Body.Data.Site.E_Day',
+    'E_Year': 'Body.Data.Site.E_Year',
+}
+ENERGY_FIELDS = ('E_Day', 'E_Year')
+
+# Lifetime energy counters (Wh) of a smart meter at the grid connection
+METER_FIELDS = {
+    'E_Import': 'Body.Data.EnergyReal_WAC_Sum_Consumed',
+    'E_Export': 'Body.Data.EnergyReal_WAC_Sum_Produced',
+}
 
 class FroniusAPI:
     def __init__(self, inverter_ip):
         self.inverter_ip = inverter_ip
         self.base_url = f"http://{inverter_ip}/solar_api/v1"
 
-    def get_current_data(self):
-        """Get current power data from Fronius inverter"""
+    def get_fields(self, endpoint, fields, timeout=10):
+        """Read selected fields of a Solar API endpoint
+
+        fields maps result names to dotted paths in the response document,
+        only those values are extracted from the stream.
+        """
         try:
-            url = f"{self.base_url}/GetPowerFlowRealtimeData.fcgi"
+            url = f"{self.base_url}/{endpoint}"
 
-            with requests.get(url, timeout=10) as response:
+            with span('query'):
+                response = request('GET', url, timeout=timeout, stream=True,
+                                   headers={'Accept-Encoding': ACCEPT_ENCODING})
+            with response:
                 if response.status_code == 200:
-                    data = json.loads(response.text)
-                    return self._parse_power_flow_data(data)
+                    with span('parse'):
+                        found = extract(iter_content(response, 256), fields.values())
+                    return {k: found.get(path) for k, path in fields.items()}
                 else:
                     print(f"HTTP Error: {response.status_code}")
                     return None
@@ -25,32 +56,33 @@ class FroniusAPI:
             print(f"Error fetching data from inverter: {e}")
             return None
 
-    def _parse_power_flow_data(self, data):
-        """Parse power flow data from Fronius API response"""
-        try:
-            # print(json.dumps(data, indent=2))
-            power_flow = data.get('Body', {}).get('Data', {}).get('Site', {})
-            inverter = data.get('Body', {}).get('Data', {}).get('Inverters', {}).get('1', {})
-
-            return {
-                'P_PV': power_flow.get('P_PV', 0),
-                'P_Akku': power_flow.get('P_Akku', 0),
-                'P_Grid': power_flow.get('P_Grid', 0),
-                'SOC': inverter.get('SOC', 0),
-                'Autonomy': power_flow.get('rel_Autonomy', 0),
-                'timestamp': data.get('Head', {}).get('Timestamp', '')
-            }
-
-        except Exception as e:
-            print(f"Error parsing power flow data: {e}")
+    def get_current_data(self):
+        """Get current power data from Fronius inverter"""
+        data = self.get_fields("GetPowerFlowRealtimeData.fcgi", POWER_FLOW_FIELDS)
+        if data is None:
             return None
 
+        # Missing values and nulls (e.g. P_PV at night) read as 0,
+        # energy counters stay None where they are not reported
+        for k, v in data.items():
+            if v is None and k not in ENERGY_FIELDS:
+                data[k] = '' if k == 'timestamp' else 0
+        return data
+
+    def get_meter_data(self, device_id=0):
+        """Import and export counters of a smart meter, None if the request failed
+
+        Without a meter the counters are None.
+        """
+        return self.get_fields(
+            f"GetMeterRealtimeData.cgi?Scope=Device&DeviceId={device_id}", METER_FIELDS)
+
     def get_inverter_info(self):
         """Get basic inverter information"""
         try:
             url = f"{self.base_url}/GetInverterInfo.cgi"
 
-            with requests.get(url) as response:
+            with request('GET', url) as response:
                 if response.status_code == 200:
                     return json.loads(response.text)
                 else:
@@ -79,3 +111,4 @@ if __name__ == '__main__':
     api = FroniusAPI('192.168.99.240')
     print(api.get_inverter_info())
     print(api.get_current_data())
+    print(api.get_meter_data())
@@ -0,0 +1,109 @@
+"""Compact glyph-subset fonts, compiled on the host by compile_font.py
+
+Layout of a .glf file, little endian:
+
+    header  magic 'GLF1', glyph count (H), bounding box w, h, x, y,
+            ascent, descent (b each)
+    index   per glyph, sorted by code point: code point (H), width,
+            height (B), dx, dy, shift_x (b), bitmap offset (I)
+    bitmaps rows padded to full bytes, MSB first
+
+Only header and index are read when a font is opened; a glyph bitmap is
+read from the file the first time get_glyph() asks for it.
+"""
+import struct
+
+try:
+    from displayio import Bitmap
+    from fontio import Glyph
+except ImportError:
+    Bitmap = None
+    Glyph = None
+
+MAGIC = b'GLF1'
+HEADER = '<4sHbbbbbb'
+ENTRY = '<HBBbbbI'
+
+
+class RowGlyph:
+    """Host stand-in for fontio.Glyph, bitmap holds the row bits"""
+
+    def __init__(self, bitmap, tile_index, width, height, dx, dy, shift_x, shift_y):
+        self.bitmap = bitmap
+        self.rows = bitmap
+        self.tile_index = tile_index
+        self.width = width
+        self.height = height
+        self.dx = dx
+        self.dy = dy
+        self.shift_x = shift_x
+        self.shift_y = shift_y
+
+
+class GlyphFont:
+    """Font read from a .glf file, usable wherever a bitmap_font font is
+
+    Like bitmap_font.load_font(), glyph bitmaps are made with the bitmap
+    class, displayio.Bitmap where available. Without one the glyphs are
+    RowGlyphs for the host framebuffer.
+    """
+
+    def __init__(self, path, bitmap=Bitmap):
+        self._bitmap = bitmap
+        self._file = open(path, 'rb')
+        header = self._file.read(struct.calcsize(HEADER))
+        magic, count, w, h, x, y, self.ascent, self.descent = struct.unpack(HEADER, header)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a glyph font")
+        self._bbox = (w, h, x, y)
+        self._index = self._file.read(count * struct.calcsize(ENTRY))
+        self._count = count
+        self._glyphs = {}
+
+    def get_bounding_box(self):
+        return self._bbox
+
+    def load_glyphs(self, code_points):
+        if isinstance(code_points, int):
+            code_points = (code_points,)
+        for code_point in code_points:
+            self.get_glyph(code_point if isinstance(code_point, int) else ord(code_point))
+
+    def get_glyph(self, code_point):
+        if code_point in self._glyphs:
+            return self._glyphs[code_point]
+        entry = self._find(code_point)
+        glyph = None if entry is None else self._read(*entry)
+        self._glyphs[code_point] = glyph
+        return glyph
+
+    def _find(self, code_point):
+        """Binary search of the index, (width, height, dx, dy, shift_x, offset) or None"""
+        size = struct.calcsize(ENTRY)
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry = struct.unpack_from(ENTRY, self._index, mid * size)
+            if entry[0] == code_point:
+                return entry[1:]
+            if entry[0] < code_point:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def _read(self, width, height, dx, dy, shift_x, offset):
+        row_bytes = (width + 7) // 8
+        self._file.seek(offset)
+        data = self._file.read(row_bytes * height)
+        rows = [int.from_bytes(data[i * row_bytes:(i + 1) * row_bytes], 'big') >> (row_bytes * 8 - width)
+                for i in range(height)]
+        if self._bitmap is None:
+            return RowGlyph(rows, 0, width, height, dx, dy, shift_x, 0)
+
+        bitmap = self._bitmap(max(width, 1), max(height, 1), 2)
+        for y, bits in enumerate(rows):
+            for x in range(width):
+                if bits & (1 << (width - 1 - x)):
+                    bitmap[x, y] = 1
+        return Glyph(bitmap, 0, width, height, dx, dy, shift_x, 0)
@@ -0,0 +1,70 @@
+import time
+
+try:
+    import alarm
+    import microcontroller
+except ImportError:
+    alarm = None
+    microcontroller = None
+
+ON_BOARD = microcontroller is not None
+
+
+class DeepSleep(Exception):
+    """Raised by deep_sleep() where the board cannot actually sleep"""
+
+    def __init__(self, seconds):
+        super().__init__(f"Deep sleep for {seconds}s")
+        self.seconds = seconds
+
+
+if alarm is not None:
+    # RTC memory, survives deep sleep but not a power cycle
+    sleep_memory = alarm.sleep_memory
+    # Flash, survives resets and power cycles but wears with every write
+    nvm = microcontroller.nvm
+
+    def woke_from_alarm():
+        return alarm.wake_alarm is not None
+
+    def deep_sleep(seconds):
+        """Deep sleep for seconds, the board restarts code.py afterwards"""
+        time_alarm = alarm.time.TimeAlarm(monotonic_time=time.monotonic() + seconds)
+        alarm.exit_and_deep_sleep_until_alarms(time_alarm)
+
+    def reset():
+        microcontroller.reset()
+
+else:
+    class _Memory:
+        """Indexing and slicing only, like the board's memories: struct
+        cannot unpack from them directly"""
+
+        def __init__(self, size):
+            self._data = bytearray(size)
+
+        def __len__(self):
+            return len(self._data)
+
+        def __getitem__(self, index):
+            return self._data[index]
+
+        def __setitem__(self, index, value):
+            self._data[index] = value
+
+    # Host stand-ins: sleep memory is plain RAM, deep_sleep() raises so a
+    # caller can simulate the wakeup by building a fresh monitor
+    sleep_memory = _Memory(256)
+    nvm = _Memory(1024)
+    _slept = False
+
+    def woke_from_alarm():
+        return _slept
+
+    def deep_sleep(seconds):
+        global _slept
+        _slept = True
+        raise DeepSleep(seconds)
+
+    def reset():
+        raise SystemExit("Reset requested")
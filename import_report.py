@@ -0,0 +1,53 @@
+"""Import time and heap cost of the modules on the board
+
+    ampy --port /dev/ttyUSB0 run import_report.py
+
+Imports every module in the root of CIRCUITPY except code.py, in name
+order, and prints one line per module: its name, whether it was loaded
+from .py (compiled on the board) or .mpy, the import time in us and the
+heap it kept in bytes. A module's own imports are counted with it if
+they were not loaded before. REPORT=1 ./upload.sh runs it once with
+source and once with .mpy modules and compares the two.
+"""
+import gc
+import os
+import time
+
+SKIP = ('boot', 'code', 'main')
+
+
+def modules():
+    found = {}
+    for name in os.listdir('/'):
+        for suffix in ('.py', '.mpy'):
+            if name.endswith(suffix):
+                module = name[:-len(suffix)]
+                # A .py is imported before an .mpy of the same name
+                if module not in SKIP and found.get(module) != 'py':
+                    found[module] = suffix[1:]
+    return sorted(found.items())
+
+
+def report():
+    total_time = 0
+    total_heap = 0
+    for module, kind in modules():
+        gc.collect()
+        free = gc.mem_free()
+        start = time.monotonic_ns()
+        try:
+            __import__(module)
+        except Exception as e:
+            print(f"# {module}: {e}")
+            continue
+        took = (time.monotonic_ns() - start) // 1000
+        gc.collect()
+        kept = free - gc.mem_free()
+        total_time += took
+        total_heap += kept
+        print(f"{module} {kind} {took} {kept}")
+    gc.collect()
+    print(f"# total {total_time} us, {total_heap} b, {gc.mem_free()} b free")
+
+
+report()
@@ -1,7 +1,32 @@
-import gc
-from network import requests
+import json
+
+from network import ACCEPT_ENCODING, request, iter_lines, setting
+from telemetry import span
+
+# Ask for plain CSV of the values only: no annotation rows, and besides
+# result and table no columns but _field and _value
+COMPACT = setting("INFLUX_COMPACT", True)
+
+
+def query_body(script, compact=COMPACT):
+    """Request body and content type for a Flux script"""
+    if not compact:
+        return script, 'application/vnd.flux'
+    body = json.dumps({
+        'query': script,
+        'type': 'flux',
+        'dialect': {'header': True, 'annotations': []},
+    })
+    return body, 'application/json'
+
+
+def project(query, compact=COMPACT):
+    """Reduce the tables of a query to their _field and _value columns"""
+    query = query.strip()
+    if compact:
+        query += '\n  |> keep(columns: ["_field", "_value"])'
+    return query
 
-from adafruit_connection_manager import connection_manager_close_all
 
 class InfluxAPI:
     def __init__(self, url, org, token):
@@ -9,41 +34,129 @@ class InfluxAPI:
         self._org = org
         self._token = token
 
-    def get_point(self, query):
-        # Preparation in order for the ESP32 to be capable of a simple POST
-        gc.collect()
-        connection_manager_close_all()
-
+    def _post(self, query):
+        body, content_type = query_body(query)
         headers = {
             'Authorization': f'Token {self._token}',
-            'Content-Type': 'application/vnd.flux'
+            'Content-Type': content_type,
+            'Accept': 'application/csv',
+            'Accept-Encoding': ACCEPT_ENCODING,
         }
-        with requests.post(
+        return request(
+            'POST',
             f'{self._url}/api/v2/query?org={self._org}',
             headers=headers,
-            data=query,
-            timeout=10
-            ) as response:
-
-            # print(response.text)
+            data=body,
+            timeout=10,
+            stream=True
+            )
 
+    def get_point(self, query):
+        with span('query'):
+            response = self._post(project(query))
+        with response:
             if response.status_code not in [200, 201, 202]:
                 print(response.text)
                 return None
 
-            lines = response.text.strip().split('\n')
-
-            col=None
-            for line in lines:
-                parts = [l.strip() for l in line.split(',')]
-                if col is None and '_value' in parts:
-                    col = parts.index('_value')
-                elif col is not None and len(parts) > col:
-                    try:
-                        return float(parts[col])
-                    except (ValueError, IndexError):
-                        continue
-            return None
+            with span('parse'):
+                return parse_value(iter_lines(response))
+
+    def get_points(self, queries, keys=None):
+        """Run several queries as one Flux script, return {key: float}
+
+        Every query is terminated by a named yield(), so each table in the
+        response carries its key in the 'result' column. keys defaults to
+        the query names; (result, field) pairs pick single fields out of
+        queries returning several.
+        """
+        script = '\n'.join(
+            f'{project(query)}\n  |> yield(name: "{key}")'
+            for key, query in queries.items()
+        )
+
+        with span('query'):
+            response = self._post(script)
+        with response:
+            if response.status_code not in [200, 201, 202]:
+                print(response.text)
+                return {}
+
+            with span('parse'):
+                return parse_results(iter_lines(response), keys or queries)
+
+    def write(self, bucket, lines, precision='s'):
+        """Write line protocol records to bucket, True on success"""
+        with request(
+            'POST',
+            f'{self._url}/api/v2/write?org={self._org}&bucket={bucket}&precision={precision}',
+            headers={
+                'Authorization': f'Token {self._token}',
+                'Content-Type': 'text/plain; charset=utf-8'
+            },
+            data='\n'.join(lines),
+            timeout=10
+            ) as response:
+            if response.status_code not in [200, 204]:
+                print(response.text)
+                return False
+            return True
+
+
+def parse_value(lines):
+    """Return the first '_value' of a CSV stream, stop reading there
+
+    Works with and without annotation rows.
+    """
+    col = None
+    for line in lines:
+        parts = line.split(',')
+        if col is None:
+            if '_value' in parts:
+                col = parts.index('_value')
+        elif len(parts) > col:
+            try:
+                return float(parts[col])
+            except ValueError:
+                continue
+    return None
+
+
+def parse_results(lines, keys):
+    """Map the 'result' column of a CSV stream to its '_value'
+
+    keys holds result names and (result, _field) pairs; a row is stored
+    under its pair if that is asked for, else under its result. Works with
+    and without annotation rows. Stops reading as soon as a value for
+    every key has been seen.
+    """
+    vals = {}
+    result_col = None
+    value_col = None
+    field_col = None
+    for line in lines:
+        parts = line.split(',')
+        if len(parts) < 2 or parts[0].startswith('#'):
+            # Blank line or annotation: a new table header follows
+            result_col = None
+        elif result_col is None:
+            if 'result' in parts and '_value' in parts:
+                result_col = parts.index('result')
+                value_col = parts.index('_value')
+                field_col = parts.index('_field') if '_field' in parts else None
+        elif len(parts) > value_col:
+            key = parts[result_col]
+            if field_col is not None and (key, parts[field_col]) in keys:
+                key = (key, parts[field_col])
+            elif key not in keys:
+                continue
+            try:
+                vals[key] = float(parts[value_col])
+            except ValueError:
+                continue
+            if len(vals) == len(keys):
+                break
+    return vals
 
 if __name__ == '__main__':
     import os
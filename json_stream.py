@@ -0,0 +1,121 @@
+_BACKSLASH = ord('\\')
+_QUOTE = ord('"')
+_WHITESPACE = b' \t\r\n'
+_STRUCTURE = b'{}[]:,'
+_ESCAPES = {ord('n'): '\n', ord('t'): '\t', ord('r'): '\r', ord('b'): '\b', ord('f'): '\f'}
+
+
+def extract(chunks, paths, max_string=64):
+    """Pick the values at dotted paths out of a JSON byte stream
+
+    chunks is any iterable of bytes (e.g. response.iter_content()), paths
+    are dotted member names such as 'Body.Data.Site.P_PV'; array elements
+    are addressed by their index. Only the requested scalars are kept, so
+    neither the document text nor the decoded tree is ever held in memory.
+    Reading stops once every path has been seen. Returns {path: value}.
+    """
+    wanted = {}
+    depths = set()
+    for p in paths:
+        keys = tuple(p.split('.'))
+        wanted[keys] = p
+        depths.add(len(keys))
+
+    found = {}
+    path = []  # member name or index of every open container
+    arrays = []  # whether each open container is an array
+    expect_key = False
+
+    for kind, value in _tokens(chunks, max_string):
+        if kind == '{' or kind == '[':
+            arrays.append(kind == '[')
+            path.append(0 if kind == '[' else None)
+            expect_key = kind == '{'
+        elif kind == '}' or kind == ']':
+            arrays.pop()
+            path.pop()
+            expect_key = False
+        elif kind == ',':
+            if arrays[-1]:
+                path[-1] += 1
+            else:
+                expect_key = True
+        elif kind == ':':
+            pass
+        elif expect_key:
+            path[-1] = value
+            expect_key = False
+        elif len(path) in depths:
+            p = wanted.get(tuple(str(k) for k in path))
+            if p is not None:
+                found[p] = value
+                if len(found) == len(wanted):
+                    break
+    return found
+
+
+def _tokens(chunks, max_string):
+    """Yield (kind, value) tokens, strings are cut at max_string bytes
+
+    \\uXXXX escapes are kept verbatim.
+    """
+    buf = bytearray()
+    in_string = False
+    escape = False
+    in_scalar = False
+
+    for chunk in chunks:
+        for c in chunk:
+            if in_string:
+                if escape:
+                    escape = False
+                    if len(buf) < max_string:
+                        buf.extend(_ESCAPES.get(c, chr(c)).encode())
+                elif c == _BACKSLASH:
+                    escape = True
+                elif c == _QUOTE:
+                    in_string = False
+                    yield 'str', buf.decode()
+                    buf = bytearray()
+                elif len(buf) < max_string:
+                    buf.append(c)
+                continue
+
+            if in_scalar:
+                if c in _WHITESPACE or c in _STRUCTURE:
+                    in_scalar = False
+                    yield 'scalar', _scalar(buf)
+                    buf = bytearray()
+                else:
+                    if len(buf) < max_string:
+                        buf.append(c)
+                    continue
+
+            if c in _WHITESPACE:
+                continue
+            if c in _STRUCTURE:
+                yield chr(c), None
+            elif c == _QUOTE:
+                in_string = True
+            else:
+                in_scalar = True
+                buf.append(c)
+
+    if in_scalar:
+        yield 'scalar', _scalar(buf)
+
+
+def _scalar(buf):
+    text = buf.decode()
+    if text == 'true':
+        return True
+    if text == 'false':
+        return False
+    if text == 'null':
+        return None
+    try:
+        if '.' in text or 'e' in text or 'E' in text:
+            return float(text)
+        return int(text)
+    except ValueError:
+        return text
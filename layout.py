@@ -0,0 +1,103 @@
+WIDTH = 250
+HEIGHT = 122
+
+
+class Layout:
+    """Retained widget tree of one screen
+
+    All widgets are created once through the display backend; update()
+    only swaps label texts and moves the battery bar, so a frame does not
+    allocate any widgets.
+
+    TEXT lists (key, text, x, y, font, anchor_point) - entries with a text
+    are static, the others are filled from the view model by key.
+    """
+    TEXT = []
+    BATTERY = None  # (x, y, width, height)
+    SPARKLINE = None  # (x, y, width, height)
+
+    def __init__(self, backend):
+        self.screen = backend.screen()
+
+        self._labels = {}
+        for key, text, x, y, font, anchor_point in self.TEXT:
+            text_area = backend.label(self.screen, text or "", x, y, font, anchor_point)
+            if key is not None:
+                self._labels[key] = text_area
+
+        self._battery = None
+        if self.BATTERY is not None:
+            self._battery = backend.battery_bar(self.screen, *self.BATTERY)
+
+        self._sparkline = None
+        if self.SPARKLINE is not None:
+            self._sparkline = backend.sparkline(self.screen, *self.SPARKLINE)
+
+    def update(self, view, values):
+        for key, text_area in self._labels.items():
+            text = view.get(key, "")
+            if text_area.text != text:
+                text_area.text = text
+
+        if self._battery is not None:
+            self._battery.update(values.get('batt_now', 0), values.get('batt_max', 0))
+
+        if self._sparkline is not None:
+            self._sparkline.update(values.get('sparkline', ()))
+
+
+def battery_geometry(current_value, max_value, height):
+    """Fill height and max line offset (from the top) of the battery bar in pixels"""
+    current_value = max(0, min(100, current_value))
+    fill_height = int((current_value / 100.0) * (height - 2))  # Leave space for borders
+    fill_height = max(0, min(fill_height, height - 2))
+    max_y = height - 1 - int((max_value / 100.0) * (height - 2))
+    return fill_height, max_y
+
+
+class DashboardLayout(Layout):
+    """Energy dashboard fed from Influx"""
+    TEXT = [
+        # PV values top left, autonomy top right
+        ('pv_now', None, 10, 10, 'small', (0, 0)),
+        ('autonomy', None, 240, 10, 'small', (1.0, 0)),
+
+        # PV values top
+        (None, "PV", 125, 3, 'small', (0.5, 0)),
+        ('pv_day', None, 122, 15, 'large', (1, 0)),
+        ('pv_year', None, 122, 33, 'small', (1, 0)),
+        (None, "kWh", 128, 31, 'large', (0, 0.5)),
+
+        # Grid import on left
+        (None, "Import", 10, 48, 'small', (0, 0)),
+        ('imp_day', None, 40, 60, 'large', (1, 0)),
+        ('imp_year', None, 40, 78, 'small', (1, 0)),
+        (None, "kWh", 46, 76, 'large', (0, 0.5)),
+
+        # Grid export on right
+        (None, "Export", 240, 48, 'small', (1, 0)),
+        ('exp_day', None, 210, 60, 'large', (1, 0)),
+        ('exp_year', None, 210, 78, 'small', (1, 0)),
+        (None, "kWh", 216, 76, 'large', (0, 0.5)),
+
+        # Time at bottom center, stale marker bottom left
+        ('time', None, 125, 122, 'small', (0.5, 1.0)),
+        ('stale', None, 10, 122, 'small', (0, 1.0)),
+    ]
+    BATTERY = (125 - 6, 54, 12, 40)
+
+    # Recent PV power below the PV values top left
+    SPARKLINE = (10, 24, 80, 18)
+
+
+class PowerFlowLayout(Layout):
+    """Live power flow fed from the Fronius inverter"""
+    TEXT = [
+        ('P_PV', None, 10, 10, 'large', (0, 0)),
+        ('P_Grid', None, 10, 30, 'large', (0, 0)),
+        ('P_Load', None, 10, 50, 'large', (0, 0)),
+        ('SOC', None, 10, 70, 'small', (0, 0)),
+        ('Autonomy', None, 10, 86, 'small', (0, 0)),
+        ('time', None, 120, 110, 'small', (0, 0)),
+        ('stale', None, 240, 110, 'small', (1.0, 0)),
+    ]
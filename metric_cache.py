@@ -0,0 +1,76 @@
+import time
+
+from network import setting
+
+
+class MetricCache:
+    """Last known value of each metric, refetched once its TTL expired
+
+    TTLs (seconds) can be overridden per metric in settings.toml as
+    TTL_<key>, e.g. TTL_PV_YEAR = 7200.
+    """
+
+    def __init__(self, ttls):
+        self.ttls = {k: setting(f"TTL_{k}", ttl) for k, ttl in ttls.items()}
+        self._values = {}
+        self._fetched_at = {}
+
+    def _overdue(self, key, t):
+        fetched_at = self._fetched_at.get(key)
+        if fetched_at is None:
+            return None
+        return t - fetched_at - self.ttls[key]
+
+    def due(self):
+        """Keys to fetch this cycle"""
+        t = time.monotonic()
+        keys = []
+        for key in self.ttls:
+            overdue = self._overdue(key, t)
+            if overdue is None or overdue >= 0:
+                keys.append(key)
+        return keys
+
+    def update(self, vals):
+        t = time.monotonic()
+        for key, value in vals.items():
+            if key in self.ttls:
+                self._values[key] = value
+                self._fetched_at[key] = t
+
+    def stale(self):
+        """Keys whose value is missing or older than its TTL"""
+        t = time.monotonic()
+        stale = []
+        for key in self.ttls:
+            overdue = self._overdue(key, t)
+            if overdue is None or overdue > 0:
+                stale.append(key)
+        return stale
+
+    def values(self):
+        return dict(self._values)
+
+    def next_due(self):
+        """Seconds until the next metric expires, 0 if one is due already"""
+        t = time.monotonic()
+        wait = None
+        for key in self.ttls:
+            overdue = self._overdue(key, t)
+            if overdue is None or overdue >= 0:
+                return 0
+            if wait is None or -overdue < wait:
+                wait = -overdue
+        return wait or 0
+
+    def state(self):
+        """(key, value, age in seconds) of every cached metric"""
+        t = time.monotonic()
+        return [(k, v, t - self._fetched_at[k]) for k, v in self._values.items()]
+
+    def restore(self, entries):
+        t = time.monotonic()
+        for key, value, age in entries:
+            if key in self.ttls:
+                self._values[key] = value
+                self._fetched_at[key] = t - age
@@ -0,0 +1,91 @@
+"""Declarative Influx metrics and a planner that fuses them into few queries"""
+
+# Calendar ranges: the local day and year so far
+DAY = "day"
+YEAR = "year"
+
+# Aggregations, applied per field
+MEAN = "|> mean()"
+LAST = "|> last()"
+DAILY_MAX_MEAN = """|> aggregateWindow(every: 1d, fn: max, createEmpty: false)
+  |> mean()"""
+INCREASE = """|> difference()
+  |> sum()"""  # of a cumulative counter
+
+_QUERY = """
+from(bucket: "{bucket}")
+  |> range(start: {start})
+  |> filter(fn: (r) => r["_measurement"] == "{measurement}")
+  |> filter(fn: (r) => {fields})
+  |> keep(columns: ["_time", "_field", "_value"])
+  |> group(columns: ["_field"])
+  {aggregate}"""
+
+
+class Metric:
+    """One dashboard value: aggregate of a field over the last start (e.g. -1d)
+
+    start DAY or YEAR covers the calendar day or year so far instead. The
+    result is multiplied by scale, e.g. 0.001 for Wh counters shown in kWh.
+    """
+
+    def __init__(self, bucket, measurement, field, start, aggregate, scale=1.0):
+        self.bucket = bucket
+        self.measurement = measurement
+        self.field = field
+        self.start = start
+        self.aggregate = aggregate
+        self.scale = scale
+
+
+def calendar_starts(t, local):
+    """{DAY: Unix time of the last local midnight, YEAR: of 1 January}
+
+    t is the current Unix time, local the current local datetime. Across
+    a daylight saving change the year start is off by the change, an
+    hour around midnight of 1 January.
+    """
+    midnight = t - (local.hour * 3600 + local.minute * 60 + local.second)
+    days = (type(local)(local.year, local.month, local.day) - type(local)(local.year, 1, 1)).days
+    return {DAY: midnight, YEAR: midnight - days * 86400}
+
+
+def plan(metrics, calendar=None):
+    """Fuse metrics into Flux queries, one per bucket, measurement, range and aggregation
+
+    metrics maps keys to Metric. Every query reads its range once for all
+    of its fields and returns one table per field. Calendar metrics need
+    calendar, the calendar_starts() of now. Returns the queries, named by
+    result, and {(result, field): key} to name what comes back.
+    """
+    groups = {}
+    for key, metric in metrics.items():
+        group = (metric.bucket, metric.measurement, metric.start, metric.aggregate)
+        groups.setdefault(group, []).append(key)
+
+    queries = {}
+    names = {}
+    for (bucket, measurement, start, aggregate), keys in groups.items():
+        # The first metric names the query
+        result = keys[0]
+        fields = [metrics[k].field for k in keys]
+        queries[result] = _QUERY.format(
+            bucket=bucket,
+            measurement=measurement,
+            start=calendar[start] if start in (DAY, YEAR) else start,
+            fields=' or '.join(f'r["_field"] == "{f}"' for f in sorted(set(fields))),
+            aggregate=aggregate,
+        )
+        for key, field in zip(keys, fields):
+            names[(result, field)] = key
+    return queries, names
+
+
+def resolve(vals, metrics, names):
+    """Turn get_points() results of plan() queries into {key: scaled value}"""
+    resolved = {}
+    for name, value in vals.items():
+        key = names.get(name)
+        if key is not None:
+            resolved[key] = value * metrics[key].scale
+    return resolved
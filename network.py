@@ -1,5 +1,34 @@
+import gc
+import os
+import time
+
+from telemetry import span
+
 try:
-    import requests
+    import zlib
+except ImportError:
+    zlib = None
+
+try:
+    import requests as _requests
+    from datetime import datetime
+
+    # Session keeps one pooled keep-alive connection per host
+    requests = _requests.Session()
+    _RECONNECT_ERRORS = (_requests.ConnectionError,)
+
+    def close_all():
+        requests.close()
+
+    def reconnect():
+        close_all()
+
+    def now():
+        return datetime.now()
+
+    def epoch():
+        return int(time.time())
+
 except:
     import wifi
     import adafruit_requests
@@ -12,6 +41,17 @@ except:
     _ssl_context = adafruit_connection_manager.get_radio_ssl_context(wifi.radio)
 
     requests = adafruit_requests.Session(_pool, _ssl_context)
+    _RECONNECT_ERRORS = (OSError, adafruit_requests.OutOfRetries)
+
+    def close_all():
+        adafruit_connection_manager.connection_manager_close_all()
+
+    def reconnect():
+        """Drop all sockets and rejoin the WiFi network of settings.toml"""
+        close_all()
+        wifi.radio.enabled = False
+        wifi.radio.enabled = True
+        wifi.radio.connect(os.getenv("CIRCUITPY_WIFI_SSID"), os.getenv("CIRCUITPY_WIFI_PASSWORD"))
 
     print("Setting up NTP...")
     _ntp = NTP(_pool, cache_seconds=3600)
@@ -31,3 +71,132 @@ except:
             offset = 1  # Winter
 
         return utc_now + timedelta(hours=offset)
+
+    def epoch():
+        """Unix time in seconds from NTP"""
+        return time.mktime(_ntp.datetime)
+
+
+def setting(name, default):
+    """Read a value from settings.toml (or the environment), typed like default"""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    if isinstance(default, bool):
+        return str(value).lower() not in ('0', 'false', 'no', '')
+    return type(default)(value)
+
+
+# Keep sockets open across requests, close them only when the heap runs low
+KEEP_ALIVE = setting("HTTP_KEEP_ALIVE", True)
+MEM_WATERMARK = setting("HTTP_MEM_WATERMARK", 40000)
+
+# Ask for gzip compressed responses where zlib can inflate them while
+# streaming. The window (bits) has to be at least the one the server
+# compresses with. Where zlib cannot inflate incrementally (CircuitPython)
+# responses stay uncompressed, unless HTTP_GZIP_BUFFERED allows reading
+# compressed bodies of up to HTTP_GZIP_MAX_BUFFER bytes whole and
+# inflating them at once, which gives up the bounded memory of the parsers
+GZIP_BUFFERED = setting("HTTP_GZIP_BUFFERED", False)
+GZIP = setting("HTTP_GZIP", True) and zlib is not None and (
+    hasattr(zlib, 'decompressobj') or GZIP_BUFFERED)
+GZIP_WINDOW = setting("HTTP_GZIP_WINDOW", 15)
+GZIP_MAX_BUFFER = setting("HTTP_GZIP_MAX_BUFFER", 8192)
+ACCEPT_ENCODING = 'gzip' if GZIP else 'identity'
+
+
+def mem_free():
+    """Free heap in bytes, None where the runtime cannot tell"""
+    try:
+        return gc.mem_free()
+    except AttributeError:
+        return None
+
+
+def reclaim(watermark=MEM_WATERMARK):
+    """Close pooled sockets if the free heap dropped below watermark"""
+    gc.collect()
+    free = mem_free()
+    if not KEEP_ALIVE or (free is not None and free < watermark):
+        close_all()
+        gc.collect()
+
+
+def request(method, url, **kwargs):
+    """Request on the shared session, reconnect once if the server closed the socket"""
+    with span('gc'):
+        reclaim()
+    try:
+        return requests.request(method, url, **kwargs)
+    except _RECONNECT_ERRORS as e:
+        print(f"Connection lost ({e}), reconnecting...")
+        close_all()
+        return requests.request(method, url, **kwargs)
+
+
+def iter_content(response, chunk_size=256):
+    """Yield the body of a streamed response in chunks, inflated if gzip encoded
+
+    Request it with 'Accept-Encoding': ACCEPT_ENCODING. Inflated chunks
+    are at most chunk_size bytes.
+    """
+    raw = getattr(response, 'raw', None)
+    if raw is not None and hasattr(raw, 'stream'):
+        # requests would inflate on its own, take the bytes as sent
+        chunks = raw.stream(chunk_size, decode_content=False)
+    else:
+        chunks = response.iter_content(chunk_size=chunk_size)
+    if response.headers.get('content-encoding') != 'gzip':
+        return chunks
+    if hasattr(zlib, 'decompressobj'):
+        return _inflate(chunks, chunk_size)
+    return _inflate_buffered(chunks, chunk_size)
+
+
+def _inflate(chunks, chunk_size):
+    inflater = zlib.decompressobj(16 + GZIP_WINDOW)
+    for chunk in chunks:
+        while chunk:
+            out = inflater.decompress(chunk, chunk_size)
+            chunk = inflater.unconsumed_tail
+            if out:
+                yield out
+    out = inflater.flush()
+    if out:
+        yield out
+
+
+def _inflate_buffered(chunks, chunk_size):
+    body = bytearray()
+    for chunk in chunks:
+        body.extend(chunk)
+        if len(body) > GZIP_MAX_BUFFER:
+            raise ValueError(f"Compressed response over {GZIP_MAX_BUFFER}b")
+    body = zlib.decompress(body, 16 + GZIP_WINDOW)
+    for start in range(0, len(body), chunk_size):
+        yield body[start:start + chunk_size]
+
+
+def iter_lines(response, chunk_size=256, max_line=256):
+    """Yield stripped lines of a streamed response body
+
+    Only one chunk and one partial line are held at a time, lines longer
+    than max_line are truncated.
+    """
+    line = b''
+    for chunk in iter_content(response, chunk_size):
+        start = 0
+        while True:
+            end = chunk.find(b'\n', start)
+            room = max_line - len(line)
+            if end < 0:
+                if room > 0:
+                    line += chunk[start:start + room]
+                break
+            if room > 0:
+                line += chunk[start:min(end, start + room)]
+            yield line.decode().strip()
+            line = b''
+            start = end + 1
+    if line:
+        yield line.decode().strip()
@@ -0,0 +1,146 @@
+import time
+from array import array
+
+from network import setting
+
+POWER_FIELDS = ('P_PV', 'P_Grid', 'P_Akku')
+
+# Inverter energy counters of the calendar day and year (Wh), and the
+# dashboard metrics they serve
+ENERGY_KEYS = {'E_Day': 'PV_DAY', 'E_Year': 'PV_YEAR'}
+
+
+class PowerHistory:
+    """Recent power flow samples polled from the inverter on the LAN
+
+    P_PV, P_Grid and P_Akku (W) are kept in array('f') ring buffers, SOC
+    in tenths of a percent in an array('h'), the sample times in whole
+    seconds since start. A sample is taken at most every interval seconds
+    (HISTORY_INTERVAL), size samples (HISTORY_SIZE) are kept.
+
+    metrics() serves live values under the dashboard metric keys, so they
+    need not be queried from Influx while the inverter answers: PV power
+    and state of charge from the buffers, and the PV day and year totals
+    from the energy counters of the latest sample where the inverter
+    reports them. With a breaker (recovery.Breaker) polls back off while the inverter fails.
+    """
+
+    def __init__(self, fronius_api, breaker=None, interval=10, size=90):
+        self.fronius_api = fronius_api
+        self.breaker = breaker
+        self.interval = setting("HISTORY_INTERVAL", interval)
+        self.size = setting("HISTORY_SIZE", size)
+        self._power = {f: array('f', (0 for _ in range(self.size))) for f in POWER_FIELDS}
+        self._soc = array('h', (0 for _ in range(self.size)))
+        self._times = array('L', (0 for _ in range(self.size)))
+        self._head = 0
+        self._count = 0
+        self._start = time.monotonic()
+        self._sampled_at = None
+        self._energy = {}
+
+    def _now(self):
+        return int(time.monotonic() - self._start)
+
+    def poll(self):
+        """Take a sample if one is due, True if a new one was added"""
+        t = time.monotonic()
+        if self._sampled_at is not None and t - self._sampled_at < self.interval:
+            return False
+        if self.breaker is None:
+            data = self.fronius_api.get_current_data()
+        else:
+            data = self.breaker.call(self.fronius_api.get_current_data)
+        if data is None:
+            return False
+        self._sampled_at = t
+        self.add(data)
+        return True
+
+    def add(self, data):
+        i = self._head
+        for field in POWER_FIELDS:
+            self._power[field][i] = data.get(field) or 0
+        self._soc[i] = int((data.get('SOC') or 0) * 10)
+        self._times[i] = self._now()
+        self._head = (i + 1) % self.size
+        self._count = min(self._count + 1, self.size)
+        self._energy = {k: data.get(k) for k in ENERGY_KEYS}
+
+    def _recent(self, seconds):
+        """Ring indices of the samples of the last seconds, oldest first"""
+        now = self._now()
+        for n in range(self._count, 0, -1):
+            i = (self._head - n) % self.size
+            if now - self._times[i] <= seconds:
+                yield i
+
+    def _series(self, field):
+        if field == 'SOC':
+            return self._soc, 0.1
+        return self._power[field], 1
+
+    def latest(self, field):
+        if not self._count:
+            return None
+        series, scale = self._series(field)
+        return series[(self._head - 1) % self.size] * scale
+
+    def stats(self, field, seconds):
+        """(mean, min, max) of a field over the last seconds, None without samples"""
+        series, scale = self._series(field)
+        total = 0
+        n = 0
+        low = high = None
+        for i in self._recent(seconds):
+            value = series[i]
+            total += value
+            n += 1
+            if low is None or value < low:
+                low = value
+            if high is None or value > high:
+                high = value
+        if not n:
+            return None
+        return total / n * scale, low * scale, high * scale
+
+    def metrics(self):
+        """Live values under the keys of the Influx metrics they replace
+
+        Like the Influx queries they only cover recent samples: PV_15MIN the
+        last 15 minutes, Batt_NOW the last hour. The day and year totals are
+        only taken from a sample of the last 5 minutes, so they belong to
+        the current day. Older values are left out.
+        """
+        metrics = {}
+        pv = self.stats('P_PV', 900)
+        if pv is not None:
+            metrics['PV_15MIN'] = pv[0]
+        if not self._count:
+            return metrics
+        age = self._now() - self._times[(self._head - 1) % self.size]
+        if age <= 3600:
+            metrics['Batt_NOW'] = self.latest('SOC')
+        if age <= 300:
+            for field, key in ENERGY_KEYS.items():
+                value = self._energy.get(field)
+                if value is not None:
+                    metrics[key] = value / 1000.0
+        return metrics
+
+    def sparkline(self, field, width, height):
+        """Column heights (0..height) of the last width samples, oldest first
+
+        Scaled to the largest absolute value shown.
+        """
+        series, _ = self._series(field)
+        n = min(width, self._count)
+        indices = [(self._head - n + k) % self.size for k in range(n)]
+        peak = 0
+        for i in indices:
+            peak = max(peak, abs(series[i]))
+        heights = array('B', (0 for _ in range(n)))
+        if peak:
+            for k, i in enumerate(indices):
+                heights[k] = int(abs(series[i]) * height / peak + 0.5)
+        return heights
@@ -0,0 +1,133 @@
+import gc
+import time
+
+import hardware
+import telemetry
+from network import close_all, reconnect, mem_free, setting
+
+
+class Breaker:
+    """Exponential backoff and circuit breaker for one data source
+
+    After a failure the source is skipped for base seconds, doubling with
+    every further failure up to cap. From threshold consecutive failures
+    on the circuit counts as open; the call after the backoff is a single
+    trial, its success closes the circuit again.
+    """
+
+    def __init__(self, name, recovery, base=2, cap=300, threshold=3):
+        self.name = name
+        self.recovery = recovery
+        self.base = setting("RECOVERY_BACKOFF", base)
+        self.cap = setting("RECOVERY_BACKOFF_MAX", cap)
+        self.threshold = threshold
+        self.failures = 0
+        self._retry_at = 0
+
+    @property
+    def open(self):
+        return self.failures >= self.threshold
+
+    def allow(self):
+        return time.monotonic() >= self._retry_at
+
+    def success(self):
+        if self.open:
+            print(f"{self.name}: circuit closed")
+        self.failures = 0
+        self._retry_at = 0
+        self.recovery.succeeded()
+
+    def failure(self, error=None):
+        self.failures += 1
+        backoff = min(self.cap, self.base * 2 ** (self.failures - 1))
+        self._retry_at = time.monotonic() + backoff
+        state = "circuit open, " if self.open else ""
+        print(f"{self.name} failed ({error}), {state}retry in {backoff}s")
+        self.recovery.failed()
+
+    def call(self, func, *args):
+        """func(*args), None while backing off or on failure
+
+        Exceptions and empty results count as failures.
+        """
+        if not self.allow():
+            return None
+        try:
+            result = func(*args)
+        except Exception as e:
+            self.failure(e)
+            return None
+        if not result:
+            self.failure("no data")
+            return None
+        self.success()
+        return result
+
+
+class Recovery:
+    """Escalating recovery from failed requests, shared by all sources
+
+    Every failure tears down the pooled sockets. After wifi_after
+    consecutive failures over all sources the WiFi is rejoined. The board
+    is only reset when the heap is unhealthy: less than RECOVERY_HEAP_MIN
+    bytes free after a collection, or a largest free IDF heap block (used
+    by sockets and TLS) below RECOVERY_BLOCK_MIN bytes.
+
+    Other errors, e.g. in rendering, leave sockets and WiFi alone: error()
+    only checks the heap and backs off like a Breaker until ok().
+    """
+
+    def __init__(self, wifi_after=3, heap_min=20000, block_min=8192, base=2, cap=300):
+        self.wifi_after = setting("RECOVERY_WIFI_AFTER", wifi_after)
+        self.heap_min = setting("RECOVERY_HEAP_MIN", heap_min)
+        self.block_min = setting("RECOVERY_BLOCK_MIN", block_min)
+        self.base = setting("RECOVERY_BACKOFF", base)
+        self.cap = setting("RECOVERY_BACKOFF_MAX", cap)
+        self.failures = 0
+        self.errors = 0
+        self.influx = Breaker("Influx", self)
+        self.fronius = Breaker("Fronius", self)
+
+    def succeeded(self):
+        self.failures = 0
+
+    def failed(self):
+        self.failures += 1
+        close_all()
+        if self.failures % self.wifi_after == 0:
+            print("Reconnecting WiFi...")
+            try:
+                reconnect()
+            except Exception as e:
+                print(f"WiFi reconnect failed: {e}")
+            self.check_heap()
+
+    def error(self):
+        """Back off after an error that is not a failed request"""
+        self.errors += 1
+        self.check_heap()
+        backoff = min(self.cap, self.base * 2 ** (self.errors - 1))
+        print(f"Retry in {backoff}s")
+        time.sleep(backoff)
+
+    def ok(self):
+        self.errors = 0
+
+    def heap_ok(self):
+        gc.collect()
+        free = mem_free()
+        if free is not None and free < self.heap_min:
+            print(f"Heap low: {free}b free")
+            return False
+        block = telemetry.largest_free()
+        if block and block < self.block_min:
+            print(f"Heap fragmented: largest free block {block}b")
+            return False
+        return True
+
+    def check_heap(self):
+        """Reset the board if the heap is unhealthy"""
+        if not self.heap_ok():
+            time.sleep(1)
+            hardware.reset()
@@ -0,0 +1,100 @@
+import time
+
+
+def _fnv(h, text):
+    for c in text.encode():
+        h = ((h ^ c) * 0x01000193) & 0xffffffff
+    return h
+
+
+def fingerprint(view, skip=()):
+    """Stable 32 bit FNV-1a hash of a {field: text} view model, without the fields in skip"""
+    h = 0x811c9dc5
+    for key in sorted(view):
+        if key not in skip:
+            h = _fnv(h, f"{key}={view[key]};")
+    return h
+
+
+def field_hash(key, text):
+    """Stable 32 bit FNV-1a hash of one field of a view model"""
+    return _fnv(0x811c9dc5, f"{key}={text};")
+
+
+class RefreshPolicy:
+    """Decide whether a new frame is worth a full e-paper refresh
+
+    A frame is a view model mapping field names to the formatted text that
+    ends up on the panel, plus optionally the raw numbers behind it. Fields
+    with a threshold only count as changed once their raw value moved by at
+    least that much since the last refresh. Changes below threshold are
+    held back until max_staleness seconds have passed.
+    """
+
+    def __init__(self, thresholds=None, max_staleness=None):
+        self.thresholds = thresholds or {}
+        self.max_staleness = max_staleness
+        self._fingerprint = None
+        self._rest = None  # fingerprint of the fields without threshold
+        self._fields = {}  # key: field_hash of its text, of fields with threshold
+        self._values = {}
+        self._refreshed_at = None
+
+    def should_refresh(self, view, values=None):
+        if self._fingerprint is None:
+            return True
+        if fingerprint(view) == self._fingerprint:
+            return False
+
+        if self.max_staleness is not None and \
+                time.monotonic() - self._refreshed_at >= self.max_staleness:
+            return True
+
+        if fingerprint(view, self.thresholds) != self._rest:
+            return True
+
+        values = values or {}
+        for key, threshold in self.thresholds.items():
+            if key not in view or field_hash(key, view[key]) == self._fields.get(key):
+                continue
+            if key not in values or key not in self._values:
+                return True
+            if abs(values[key] - self._values[key]) >= threshold:
+                return True
+        return False
+
+    def state(self):
+        """Frame on the panel as (fingerprint, age, rest, fields), None before the first refresh
+
+        rest is the fingerprint of the fields without threshold, fields
+        holds (field hash, raw value) of every field with a threshold, in
+        sorted order; what is missing is None.
+        """
+        if self._fingerprint is None:
+            return None
+        fields = [(self._fields.get(key), self._values.get(key)) for key in sorted(self.thresholds)]
+        return self._fingerprint, time.monotonic() - self._refreshed_at, self._rest, fields
+
+    def restore(self, fingerprint, age, rest=None, fields=()):
+        """Continue from a frame refreshed age seconds ago, e.g. before deep sleep
+
+        rest and fields as returned by state(); without them any change
+        counts regardless of thresholds.
+        """
+        self._fingerprint = fingerprint
+        self._rest = rest
+        self._fields = {}
+        self._values = {}
+        for key, (h, value) in zip(sorted(self.thresholds), fields):
+            if h is not None:
+                self._fields[key] = h
+            if value is not None:
+                self._values[key] = value
+        self._refreshed_at = time.monotonic() - age
+
+    def mark_refreshed(self, view, values=None):
+        self._fingerprint = fingerprint(view)
+        self._rest = fingerprint(view, self.thresholds)
+        self._fields = {key: field_hash(key, view[key]) for key in self.thresholds if key in view}
+        self._values = dict(values or {})
+        self._refreshed_at = time.monotonic()
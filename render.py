@@ -0,0 +1,75 @@
+"""Render the screens on the host into PBM/PNG files and time them
+
+    python render.py --fonts path/to/bdf --out out/ --runs 50
+
+Needs ter-u12n.bdf and ter-u18n.bdf in the font directory; with
+--compiled the large font is taken from ter-u18n.glf (compile_font.py).
+"""
+import argparse
+import os
+import time
+
+from framebuffer import FramebufferBackend, load_fonts
+from refresh_policy import RefreshPolicy
+from code import EPaperDisplay
+
+SAMPLE_INFLUX = {
+    'Batt_MAX': 87.5,
+    'Batt_NOW': 64.0,
+    'GridImp_YEAR': 1234.5,
+    'GridImp_DAY': 3.2,
+    'GridExp_YEAR': 4321.0,
+    'GridExp_DAY': 12.7,
+    'PV_YEAR': 7654.3,
+    'PV_DAY': 21.4,
+    'Load_YEAR': 5432.1,
+    'PV_15MIN': 3456.0,
+    # PV power of the last 80 samples, as column heights
+    'sparkline': [int(18 * (1 - ((i - 40) / 40.0) ** 2)) for i in range(80)],
+}
+
+SAMPLE_FRONIUS = {
+    'P_PV': 3456.0,
+    'P_Akku': -1200.0,
+    'P_Grid': -800.0,
+    'SOC': 64.0,
+    'Autonomy': 100.0,
+    'timestamp': '',
+}
+
+
+def render(display, name, method, data, out, runs):
+    backend = display.backend
+
+    t = time.perf_counter()
+    method(dict(data))
+    first = time.perf_counter() - t
+
+    t = time.perf_counter()
+    for _ in range(runs):
+        # Forget the last frame so every run refreshes
+        display.policy = RefreshPolicy()
+        method(dict(data))
+    per_frame = (time.perf_counter() - t) / runs
+
+    backend.fb.write_pbm(os.path.join(out, f"{name}.pbm"))
+    backend.fb.write_png(os.path.join(out, f"{name}.png"))
+    print(f"{name}: first frame {first * 1000:.1f} ms, then {per_frame * 1000:.2f} ms/frame")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--fonts', default='.', help="directory with the BDF fonts")
+    parser.add_argument('--out', default='.', help="output directory")
+    parser.add_argument('--runs', type=int, default=20, help="frames to time per screen")
+    parser.add_argument('--compiled', action='store_true', help="large font from ter-u18n.glf")
+    args = parser.parse_args()
+
+    display = EPaperDisplay(FramebufferBackend(load_fonts(args.fonts, args.compiled)))
+    os.makedirs(args.out, exist_ok=True)
+    render(display, 'dashboard', display.render_influx, SAMPLE_INFLUX, args.out, args.runs)
+    render(display, 'powerflow', display.render_fronius, SAMPLE_FRONIUS, args.out, args.runs)
+
+
+if __name__ == '__main__':
+    main()
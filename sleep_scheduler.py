@@ -0,0 +1,113 @@
+import struct
+
+import hardware
+from network import setting
+
+_MAGIC = b'EPD3'
+# magic, panel fingerprint, its age, fingerprint of the fields without
+# threshold, planned sleep, threshold field count, metric count, has year
+# checkpoint
+_HEADER = '<4sIfIfBBB'
+_FIELD = '<If'  # hash of the text of a threshold field, its raw value
+_NAN = float('nan')
+_METRIC = '<Bff'  # key index, value, age
+_YEAR = '<ii'  # checkpoint, last full scan
+_COUNTER = '<dd'  # total, last reading
+
+
+class SleepScheduler:
+    """Deep sleep between updates, keeping what a wakeup needs in sleep memory
+
+    Before sleeping, the metric cache, the frame on the panel (fingerprints
+    of all fields and of those without refresh threshold, text hash and raw
+    value of every field with one)
+    and the year counter checkpoints are packed into sleep memory.
+    After a timed wakeup they are restored, so the cycle only fetches
+    expired metrics and only refreshes if the frame changed. The sleep lasts
+    until the next metric expires, within DEEP_SLEEP_MIN..DEEP_SLEEP_MAX
+    seconds.
+    """
+
+    def __init__(self, display, min_sleep=60, max_sleep=900):
+        self.display = display
+        self.min_sleep = setting("DEEP_SLEEP_MIN", min_sleep)
+        self.max_sleep = setting("DEEP_SLEEP_MAX", max_sleep)
+        self._keys = sorted(display.cache.ttls)
+
+    def save(self, slept):
+        """Pack the state into sleep memory, ages as they will be after slept seconds"""
+        display = self.display
+        metrics = display.cache.state()
+        fingerprint, refresh_age, rest, fields = display.policy.state() or (0, 0.0, 0, [])
+        year = display.year.state() if display.year is not None else None
+
+        data = bytearray(struct.pack(
+            _HEADER, _MAGIC, fingerprint, refresh_age, rest, slept, len(fields), len(metrics),
+            year is not None))
+        for h, value in fields:
+            data.extend(struct.pack(_FIELD, h or 0, _NAN if value is None else value))
+        for key, value, age in metrics:
+            data.extend(struct.pack(_METRIC, self._keys.index(key), value, age))
+        if year is not None:
+            checkpoint, synced, counters = year
+            data.extend(struct.pack(_YEAR, checkpoint, synced))
+            for counter in counters:
+                data.extend(struct.pack(_COUNTER, *counter))
+
+        if len(data) > len(hardware.sleep_memory):
+            print("State does not fit into sleep memory")
+            return
+        hardware.sleep_memory[0:len(data)] = data
+
+    def restore(self):
+        """Restore the state saved before the last deep sleep, True if there was one"""
+        if not hardware.woke_from_alarm():
+            return False
+        # sleep_memory supports slicing but not the buffer protocol
+        # struct needs, so the record is copied out first
+        offset = struct.calcsize(_HEADER)
+        magic, fingerprint, refresh_age, rest, slept, n_fields, n, has_year = struct.unpack(
+            _HEADER, bytes(hardware.sleep_memory[0:offset]))
+        if magic != _MAGIC:
+            return False
+        display = self.display
+        size = offset + n_fields * struct.calcsize(_FIELD) + n * struct.calcsize(_METRIC)
+        if has_year and display.year is not None:
+            size += struct.calcsize(_YEAR) + len(display.year.fields) * struct.calcsize(_COUNTER)
+        memory = bytes(hardware.sleep_memory[0:size])
+
+        fields = []
+        for _ in range(n_fields):
+            h, value = struct.unpack_from(_FIELD, memory, offset)
+            offset += struct.calcsize(_FIELD)
+            # NaN marks a missing value
+            fields.append((h or None, value if value == value else None))
+
+        metrics = []
+        for _ in range(n):
+            index, value, age = struct.unpack_from(_METRIC, memory, offset)
+            offset += struct.calcsize(_METRIC)
+            metrics.append((self._keys[index], value, age + slept))
+        display.cache.restore(metrics)
+
+        if fingerprint:
+            display.policy.restore(fingerprint, refresh_age + slept, rest, fields)
+
+        if has_year and display.year is not None:
+            checkpoint, synced = struct.unpack_from(_YEAR, memory, offset)
+            offset += struct.calcsize(_YEAR)
+            counters = []
+            for _ in display.year.fields:
+                counters.append(struct.unpack_from(_COUNTER, memory, offset))
+                offset += struct.calcsize(_COUNTER)
+            display.year.restore(checkpoint, synced, counters)
+        return True
+
+    def sleep(self, seconds=None):
+        """Save the state and deep sleep until the next metric is due"""
+        if seconds is None:
+            seconds = self.display.cache.next_due()
+        seconds = min(max(seconds, self.min_sleep), self.max_sleep)
+        self.save(seconds)
+        print(f"Deep sleep for {seconds}s...")
+        hardware.deep_sleep(seconds)
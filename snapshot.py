@@ -0,0 +1,124 @@
+import struct
+import time
+
+import hardware
+from network import datetime, epoch, now, setting
+
+_MAGIC = b'SNP1'
+# magic, number of metric keys, metrics stored, Unix time of the write,
+# local time of the frame (year, month, day, hour, minute)
+_HEADER = '<4sBBiHBBBB'
+_METRIC = '<Bfi'  # key index, value, Unix time it was fetched at
+
+
+class Snapshot:
+    """Last dashboard values in NVM, painted right after a reset
+
+    save() packs the cached metric values with the Unix time they were
+    fetched at. To spare the flash it writes at most every
+    SNAPSHOT_INTERVAL seconds, also across resets, and only when a
+    metric value changed; new fetch times alone are not written. paint()
+    renders the dashboard from the record with the stale marker before
+    anything is fetched. restore() then hands the values to the metric
+    cache with their real age once the time is known, so those still
+    within their TTL are not queried again.
+    """
+
+    def __init__(self, display, interval=3600):
+        self.display = display
+        self.interval = setting("SNAPSHOT_INTERVAL", interval)
+        self._keys = sorted(display.cache.ttls)
+        self._checked_at = None
+        self._pending = None
+
+    def _load(self):
+        """(saved, clock, [(key, value, fetched)]), None without a record of these keys"""
+        # nvm supports slicing but not the buffer protocol struct needs,
+        # so the record is copied out first
+        offset = struct.calcsize(_HEADER)
+        magic, n_keys, n, saved, year, month, day, hour, minute = struct.unpack(
+            _HEADER, bytes(hardware.nvm[0:offset]))
+        if magic != _MAGIC or n_keys != len(self._keys):
+            return None
+        memory = bytes(hardware.nvm[0:offset + n * struct.calcsize(_METRIC)])
+        metrics = []
+        for _ in range(n):
+            index, value, fetched = struct.unpack_from(_METRIC, memory, offset)
+            offset += struct.calcsize(_METRIC)
+            metrics.append((self._keys[index], value, fetched))
+        return saved, datetime(year, month, day, hour, minute), metrics
+
+    def save(self):
+        """Write the cached values if SNAPSHOT_INTERVAL passed, True if written"""
+        t = time.monotonic()
+        if self._checked_at is not None and t - self._checked_at < self.interval:
+            return False
+        metrics = self.display.cache.state()
+        if not metrics:
+            return False
+        try:
+            e = epoch()
+            n = now()
+        except Exception as ex:
+            print(f"No time for a snapshot: {ex}")
+            return False
+        self._checked_at = t
+
+        record = self._load()
+        if record is not None and 0 <= e - record[0] < self.interval:
+            # Written shortly before the last reset
+            self._checked_at = t - (e - record[0])
+            return False
+
+        data = bytearray(struct.pack(
+            _HEADER, _MAGIC, len(self._keys), len(metrics), e,
+            n.year, n.month, n.day, n.hour, n.minute))
+        for key, value, age in metrics:
+            data.extend(struct.pack(_METRIC, self._keys.index(key), value, int(e - age)))
+        if len(data) > len(hardware.nvm):
+            print("Snapshot does not fit into NVM")
+            return False
+        if record is not None and _same_values(record[2], metrics):
+            print("Snapshot unchanged")
+            return False
+        hardware.nvm[0:len(data)] = data
+        print(f"Snapshot saved ({len(data)}b)")
+        return True
+
+    def paint(self):
+        """Render the dashboard from the record, marked stale; False without one"""
+        record = self._load()
+        if record is None:
+            return False
+        _, clock, metrics = record
+        vals = {key: value for key, value, _ in metrics}
+        vals['stale'] = True
+        vals['time'] = clock
+        print("Showing the last snapshot...")
+        self.display.render_influx(vals)
+        self._pending = metrics
+        return True
+
+    def restore(self):
+        """Hand the painted values to the metric cache, aged by the current time"""
+        if self._pending is None:
+            return
+        try:
+            e = epoch()
+        except Exception as ex:
+            print(f"No time to age the snapshot: {ex}")
+            return
+        self.display.cache.restore([(k, v, max(0, e - fetched)) for k, v, fetched in self._pending])
+        self._pending = None
+
+
+def _same_values(stored, metrics):
+    """True if the stored metrics have the values of metrics, whatever order and times"""
+    if len(stored) != len(metrics):
+        return False
+    # As stored: the same single precision floats
+    values = {key: struct.pack('<f', value) for key, value, _ in stored}
+    for key, value, _ in metrics:
+        if values.get(key) != struct.pack('<f', value):
+            return False
+    return True
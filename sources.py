@@ -0,0 +1,124 @@
+"""Serve each dashboard metric from the cheapest source that has it"""
+import time
+
+from fronius_api import METER_FIELDS
+from metrics import DAY, YEAR
+from network import now, setting
+
+# Meter counters and the dashboard metrics they serve, by calendar period
+METER_KEYS = {
+    ('E_Import', DAY): 'GridImp_DAY',
+    ('E_Import', YEAR): 'GridImp_YEAR',
+    ('E_Export', DAY): 'GridExp_DAY',
+    ('E_Export', YEAR): 'GridExp_YEAR',
+}
+
+
+class Sources:
+    """Local sources of dashboard metrics, cheapest first
+
+    Every source provides poll(), True when it has new values, and
+    metrics(), the values it currently serves by metric key. A metric is
+    taken from the first source serving it. Whatever no source serves
+    stays due in the metric cache and is queried from Influx; a metric a
+    source stops serving expires after its TTL and falls back to Influx
+    the same way.
+
+    A source only serves a metric with the same meaning: the day and year
+    totals are calendar day and year totals, in Influx as well as from the
+    counters of the inverter and the meter.
+    """
+
+    def __init__(self, sources):
+        self.sources = sources
+        self._served = {}  # key: index of the source serving it
+
+    def poll(self):
+        """New values by metric key"""
+        vals = {}
+        served = {}
+        for i, source in enumerate(self.sources):
+            fresh = source.poll()
+            for key, value in source.metrics().items():
+                if key in served:
+                    continue
+                served[key] = i
+                if fresh:
+                    vals[key] = value
+        if served != self._served:
+            self._served = served
+            print(f"Served locally: {', '.join(served) or 'nothing'}")
+        return vals
+
+    def served(self):
+        """Keys served locally at the last poll, not to be queried from Influx"""
+        return self._served
+
+
+class MeterCounters:
+    """Grid import and export totals from the lifetime counters of the meter
+
+    The meter only counts since it was installed. A day or year total is
+    served once the counters have been read across the start of that
+    period, the first reading in it serving as its baseline; until then
+    the totals come from Influx. Reads at most every interval seconds
+    (METER_INTERVAL); with a breaker (recovery.Breaker) reads back off
+    while the inverter fails. Without a meter reading stops.
+    """
+
+    def __init__(self, fronius_api, breaker=None, interval=60, device_id=0):
+        self.fronius_api = fronius_api
+        self.breaker = breaker
+        self.interval = setting("METER_INTERVAL", interval)
+        self.device_id = setting("METER_DEVICE_ID", device_id)
+        self._read_at = None
+        self._absent = False
+        self._counters = {}
+        self._periods = {}  # DAY or YEAR: the current one
+        self._baselines = {}  # (field, DAY or YEAR): counter at its start
+
+    def poll(self):
+        """Read the counters if due, True if new ones were read"""
+        t = time.monotonic()
+        if self._absent or self._read_at is not None and t - self._read_at < self.interval:
+            return False
+        if self.breaker is None:
+            data = self.fronius_api.get_meter_data(self.device_id)
+        else:
+            data = self.breaker.call(self.fronius_api.get_meter_data, self.device_id)
+        if data is None:
+            return False
+        self._read_at = t
+        if all(v is None for v in data.values()):
+            print("No meter counters, not reading them again")
+            self._absent = True
+            return False
+        try:
+            n = now()
+        except Exception as e:
+            print(f"No time for meter totals: {e}")
+            return False
+        self.add(data, {DAY: (n.year, n.month, n.day), YEAR: n.year})
+        return True
+
+    def add(self, data, periods):
+        """Take counters read in periods, e.g. {DAY: (2025, 6, 1), YEAR: 2025}"""
+        for period, current in periods.items():
+            if self._periods.get(period) == current:
+                continue
+            # Started within the first period seen, its baseline is unknown
+            if period in self._periods:
+                for field in METER_FIELDS:
+                    self._baselines[(field, period)] = data.get(field)
+            self._periods[period] = current
+        self._counters = data
+
+    def metrics(self):
+        """Totals in kWh of the periods with a baseline"""
+        metrics = {}
+        for (field, period), key in METER_KEYS.items():
+            baseline = self._baselines.get((field, period))
+            value = self._counters.get(field)
+            if baseline is not None and value is not None:
+                metrics[key] = (value - baseline) / 1000.0
+        return metrics
@@ -0,0 +1,138 @@
+"""Timing spans and heap telemetry of the hot path
+
+    with span('query'):
+        response = request(...)
+
+Every span records its duration (time.monotonic_ns), the change of
+gc.mem_free() and the largest free block of the IDF heap (fragmentation)
+into preallocated arrays. Nothing is recorded, and nothing allocated,
+until enable() is called. Spans of different phases may nest, e.g. the
+gc span of a request falls inside its query span.
+"""
+import gc
+import json
+import time
+from array import array
+
+try:
+    import espidf
+except ImportError:
+    espidf = None
+
+PHASES = ('query', 'parse', 'render', 'refresh', 'gc')
+MEASUREMENT = 'epaper_telemetry'
+
+_capacity = 0
+_count = 0
+_dropped = 0
+_phase = None
+_duration = None  # us
+_mem_delta = None  # bytes
+_largest = None  # bytes
+_at = None  # monotonic seconds
+
+
+def _mem_free():
+    return gc.mem_free() if hasattr(gc, 'mem_free') else 0
+
+
+def largest_free():
+    """Largest free block of the IDF heap in bytes, 0 where unknown"""
+    if espidf is None:
+        return 0
+    return espidf.heap_caps_get_largest_free_block()
+
+
+class _Span:
+    def __init__(self, phase):
+        self.phase = phase
+        self._start = 0
+        self._mem = 0
+
+    def __enter__(self):
+        self._mem = _mem_free()
+        self._start = time.monotonic_ns()
+        return self
+
+    def __exit__(self, *exc):
+        _record(self.phase, (time.monotonic_ns() - self._start) // 1000, _mem_free() - self._mem)
+        return False
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_SPANS = {name: _Span(i) for i, name in enumerate(PHASES)}
+_NO_SPAN = _NoSpan()
+
+
+def enable(capacity=64):
+    """Allocate the buffer for capacity samples and start recording"""
+    global _capacity, _phase, _duration, _mem_delta, _largest, _at
+    _phase = bytearray(capacity)
+    _duration = array('L', (0 for _ in range(capacity)))
+    _mem_delta = array('l', (0 for _ in range(capacity)))
+    _largest = array('L', (0 for _ in range(capacity)))
+    _at = array('L', (0 for _ in range(capacity)))
+    _capacity = capacity
+    clear()
+
+
+def span(phase):
+    """Context manager timing one phase of PHASES"""
+    return _SPANS[phase] if _capacity else _NO_SPAN
+
+
+def _record(phase, duration, mem_delta):
+    global _count, _dropped
+    if _count >= _capacity:
+        # Full until flushed, the oldest samples are the ones kept
+        _dropped += 1
+        return
+    i = _count
+    _phase[i] = phase
+    _duration[i] = duration
+    _mem_delta[i] = mem_delta
+    _largest[i] = largest_free()
+    _at[i] = int(time.monotonic())
+    _count += 1
+
+
+def pending():
+    """Number of buffered samples"""
+    return _count
+
+
+def clear():
+    global _count, _dropped
+    _count = 0
+    _dropped = 0
+
+
+def _samples():
+    for i in range(_count):
+        yield PHASES[_phase[i]], _duration[i], _mem_delta[i], _largest[i], _at[i]
+
+
+def lines(t):
+    """Buffered samples as line protocol, t is the current Unix time in seconds"""
+    now = int(time.monotonic())
+    for phase, duration, mem_delta, largest, at in _samples():
+        yield (f"{MEASUREMENT},phase={phase} duration_us={duration}i,"
+               f"mem_delta={mem_delta}i,largest_free={largest}i {t - (now - at)}")
+    if _dropped:
+        yield f"{MEASUREMENT},phase=dropped count={_dropped}i {t}"
+
+
+def dump():
+    """Print the buffered samples to the serial console as JSON, one per line"""
+    for phase, duration, mem_delta, largest, at in _samples():
+        print(json.dumps({'phase': phase, 'duration_us': duration, 'mem_delta': mem_delta,
+                          'largest_free': largest, 'monotonic': at}))
+    if _dropped:
+        print(json.dumps({'phase': 'dropped', 'count': _dropped}))
@@ -0,0 +1,68 @@
+import tracemalloc
+
+from influx_api import parse_results, parse_value
+from network import iter_lines
+
+ANNOTATIONS = (
+    "#datatype,string,long,dateTime:RFC3339,double,string\r\n"
+    "#group,false,false,false,false,true\r\n"
+    "#default,_result,,,,\r\n"
+)
+HEADER = ",result,table,_time,_value,_field\r\n"
+
+
+class Response:
+    """Streamed annotated CSV body of rows rows, generated while it is read"""
+
+    headers = {}
+
+    def __init__(self, rows, value=''):
+        self.rows = rows
+        self.value = value
+
+    def _body(self):
+        yield ANNOTATIONS + HEADER
+        for i in range(self.rows):
+            yield f",first,0,2025-06-01T12:00:{i % 60:02}Z,{self.value},E_PV\r\n"
+        # The only value of the last result comes at the very end
+        yield ",last,1,2025-06-01T12:00:00Z,42.5,E_PV\r\n\r\n"
+
+    def iter_content(self, chunk_size=256):
+        buffer = ''
+        for text in self._body():
+            buffer += text
+            while len(buffer) >= chunk_size:
+                yield buffer[:chunk_size].encode()
+                buffer = buffer[chunk_size:]
+        if buffer:
+            yield buffer.encode()
+
+
+def peak(parse, rows, **kwargs):
+    response = Response(rows, **kwargs)
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        result = parse(iter_lines(response))
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_parse_results_memory_is_flat():
+    peaks = []
+    for rows in (10, 1000, 100000):
+        vals, used = peak(lambda lines: parse_results(lines, ['first', 'last']), rows, value='1.5')
+        assert vals == {'first': 1.5, 'last': 42.5}
+        peaks.append(used)
+    assert max(peaks) - min(peaks) < 512, peaks
+
+
+def test_parse_value_memory_is_flat():
+    peaks = []
+    for rows in (10, 1000, 100000):
+        # Rows without a value are skipped until the last one
+        value, used = peak(parse_value, rows)
+        assert value == 42.5
+        peaks.append(used)
+    assert max(peaks) - min(peaks) < 512, peaks
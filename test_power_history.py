@@ -0,0 +1,66 @@
+import power_history
+from power_history import PowerHistory
+from sources import Sources
+
+SAMPLE = {'P_PV': 3000.0, 'P_Grid': -500.0, 'P_Akku': -1000.0, 'SOC': 64.0}
+
+
+class Clock:
+    def __init__(self):
+        self.t = 1000.0
+
+    def monotonic(self):
+        return self.t
+
+
+class Inverter:
+    def __init__(self):
+        self.up = True
+
+    def get_current_data(self):
+        return dict(SAMPLE) if self.up else None
+
+
+def history(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(power_history, 'time', clock)
+    inverter = Inverter()
+    return PowerHistory(inverter, interval=10), inverter, clock
+
+
+def test_metrics_of_recent_samples(monkeypatch):
+    h, _, _ = history(monkeypatch)
+    assert h.metrics() == {}
+    assert h.poll()
+    assert h.metrics() == {'PV_15MIN': 3000.0, 'Batt_NOW': 64.0}
+
+
+def test_outage_longer_than_15_minutes(monkeypatch):
+    h, inverter, clock = history(monkeypatch)
+    sources = Sources([h])
+    assert sources.poll() == {'PV_15MIN': 3000.0, 'Batt_NOW': 64.0}
+
+    inverter.up = False
+    clock.t += 1000
+    assert sources.poll() == {}
+    assert h.metrics() == {'Batt_NOW': 64.0}
+
+    clock.t += 3600
+    assert sources.poll() == {}
+    assert h.metrics() == {}
+
+    # Back again
+    inverter.up = True
+    assert sources.poll() == {'PV_15MIN': 3000.0, 'Batt_NOW': 64.0}
+
+
+def test_day_and_year_totals_of_a_recent_sample(monkeypatch):
+    h, _, clock = history(monkeypatch)
+    h.fronius_api.get_current_data = lambda: dict(SAMPLE, E_Day=21400.0, E_Year=None)
+    assert h.poll()
+    # E_Year is not counted, e.g. on GEN24
+    assert h.metrics()['PV_DAY'] == 21.4
+    assert 'PV_YEAR' not in h.metrics()
+
+    clock.t += 600
+    assert 'PV_DAY' not in h.metrics()
@@ -0,0 +1,32 @@
+from metrics import DAY, YEAR
+from sources import MeterCounters, Sources
+
+READING = {'E_Import': 8000000.0, 'E_Export': 15000000.0}
+
+
+class Source:
+    def __init__(self, metrics):
+        self.values = metrics
+
+    def poll(self):
+        return True
+
+    def metrics(self):
+        return self.values
+
+
+def test_first_source_serving_a_metric_wins():
+    sources = Sources([Source({'PV_DAY': 1.0}), Source({'PV_DAY': 2.0, 'GridImp_DAY': 3.0})])
+    assert sources.poll() == {'PV_DAY': 1.0, 'GridImp_DAY': 3.0}
+    assert sorted(sources.served()) == ['GridImp_DAY', 'PV_DAY']
+
+
+def test_meter_totals_once_read_across_the_period_start():
+    meter = MeterCounters(None)
+    meter.add(READING, {DAY: (2025, 6, 1), YEAR: 2025})
+    # Started within the day, its baseline is unknown
+    assert meter.metrics() == {}
+
+    meter.add({'E_Import': 8004000.0, 'E_Export': 15010000.0}, {DAY: (2025, 6, 2), YEAR: 2025})
+    meter.add({'E_Import': 8006500.0, 'E_Export': 15030000.0}, {DAY: (2025, 6, 2), YEAR: 2025})
+    assert meter.metrics() == {'GridImp_DAY': 2.5, 'GridExp_DAY': 20.0}
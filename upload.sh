@@ -4,8 +4,24 @@
 PORT=${1:-/dev/ttyUSB0}  # Default to /dev/ttyUSB0, or use first argument
 BAUD=${2:-115200}        # Default baud rate
 
+# Library modules are cross-compiled to .mpy, so the board does not have
+# to compile them at boot. mpy-cross has to match the CircuitPython
+# version of the board (e.g. MPY_CROSS=mpy-cross-linux-amd64-9.2.1.static);
+# without it, or with SOURCE=1, the sources are uploaded instead.
+# REPORT=1 deploys both ways and compares import time and heap.
+MPY_CROSS=${MPY_CROSS:-mpy-cross}
+SOURCE=${SOURCE:-0}
+REPORT=${REPORT:-0}
+
 # Python files to upload
-FILES=("code.py" "fronius_api.py" "influx_api.py" "network.py" "ubinascii.py" "settings.toml")
+FILES=("code.py" "compositor.py" "displayio_backend.py" "fronius_api.py" "glyph_font.py" "hardware.py" "influx_api.py" "json_stream.py" "layout.py" "metric_cache.py" "metrics.py" "network.py" "power_history.py" "recovery.py" "refresh_policy.py" "sleep_scheduler.py" "snapshot.py" "sources.py" "telemetry.py" "ubinascii.py" "year_counters.py" "settings.toml")
+# Run as source: CircuitPython only starts code.py
+KEEP_SOURCE=("code.py")
+
+# Compiled artifacts, and the hash of every file on the board by port;
+# delete the manifest after erasing the board to upload everything again
+BUILD=build
+MANIFEST="$BUILD/manifest.$(basename "$PORT")"
 
 echo "=== CircuitPython Upload Script ==="
 echo "Port: $PORT"
@@ -40,21 +56,137 @@ fi
 echo "Connection successful!"
 echo ""
 
-# Upload each file
-for file in "${FILES[@]}"; do
-    if [ -f "$file" ]; then
-        echo "Uploading $file..."
-        if ampy --port $PORT --baud $BAUD put "$file"; then
-            echo "✓ $file uploaded successfully"
-        else
-            echo "✗ Failed to upload $file"
+mkdir -p "$BUILD"
+
+if [ "$SOURCE" != 1 ] && ! command -v "$MPY_CROSS" &> /dev/null; then
+    echo "Warning: $MPY_CROSS not found, uploading sources"
+    echo ""
+    SOURCE=1
+fi
+
+# Board file -> hash of what was uploaded as it
+declare -A UPLOADED
+if [ -f "$MANIFEST" ]; then
+    while read -r remote hash; do
+        UPLOADED[$remote]=$hash
+    done < "$MANIFEST"
+fi
+
+save_manifest() {
+    for remote in "${!UPLOADED[@]}"; do
+        echo "$remote ${UPLOADED[$remote]}"
+    done | sort > "$MANIFEST"
+}
+
+file_hash() {
+    if command -v sha256sum &> /dev/null; then
+        sha256sum "$1" | cut -d' ' -f1
+    else
+        shasum -a 256 "$1" | cut -d' ' -f1
+    fi
+}
+
+# Upload local as remote unless the board already has it
+upload() {
+    local local_file=$1 remote=$2
+    local hash
+    hash=$(file_hash "$local_file")
+    if [ "${UPLOADED[$remote]}" = "$hash" ]; then
+        echo "= $remote unchanged"
+        return
+    fi
+    echo "Uploading $remote..."
+    if ampy --port $PORT --baud $BAUD put "$local_file" "$remote"; then
+        echo "✓ $remote uploaded successfully"
+        UPLOADED[$remote]=$hash
+        save_manifest
+    else
+        echo "✗ Failed to upload $remote"
+        exit 1
+    fi
+    echo ""
+}
+
+# Remove the other form of a module from the board, e.g. its source once
+# it is uploaded as .mpy: a .py is imported before the .mpy. The manifest
+# records the removal as "-", so it is only tried once
+remove() {
+    local remote=$1
+    if [ "${UPLOADED[$remote]}" != "-" ]; then
+        if ampy --port $PORT --baud $BAUD rm "$remote" &> /dev/null; then
+            echo "✓ $remote removed"
+        fi
+        UPLOADED[$remote]="-"
+        save_manifest
+    fi
+}
+
+deploy() {
+    local source_only=$1
+    for file in "${FILES[@]}"; do
+        if [ ! -f "$file" ]; then
+            echo "✗ File $file not found"
             exit 1
         fi
-    else
-        echo "✗ File $file not found"
+        if [[ "$file" != *.py || " ${KEEP_SOURCE[*]} " == *" $file "* ]]; then
+            upload "$file" "$file"
+            continue
+        fi
+
+        module="${file%.py}"
+        if [ "$source_only" = 1 ]; then
+            upload "$file" "$file"
+            remove "$module.mpy"
+        else
+            if [ ! -f "$BUILD/$module.mpy" ] || [ "$file" -nt "$BUILD/$module.mpy" ]; then
+                echo "Compiling $file..."
+                if ! "$MPY_CROSS" -o "$BUILD/$module.mpy" "$file"; then
+                    echo "✗ Failed to compile $file"
+                    exit 1
+                fi
+            fi
+            upload "$BUILD/$module.mpy" "$module.mpy"
+            remove "$file"
+        fi
+    done
+
+    # Compiled fonts (compile_font.py) are optional, the board falls back to BDF
+    for file in "ter-u18n.glf"; do
+        if [ -f "$file" ]; then
+            upload "$file" "$file"
+        fi
+    done
+}
+
+# Import time and heap per module as reported by import_report.py on the board
+import_report() {
+    ampy --port $PORT --baud $BAUD run import_report.py | tr -d '\r' | tee "$1"
+}
+
+if [ "$REPORT" = 1 ]; then
+    if [ "$SOURCE" = 1 ]; then
+        echo "Error: REPORT=1 needs $MPY_CROSS"
         exit 1
     fi
+    deploy 1
+    echo "=== Imports from source ==="
+    import_report "$BUILD/imports-py.txt"
+    deploy 0
+    echo "=== Imports from .mpy ==="
+    import_report "$BUILD/imports-mpy.txt"
     echo ""
-done
+    awk '
+        $2 ~ /^(py|mpy)$/ && NF == 4 {
+            if (FILENAME ~ /-py\.txt$/) { us[$1] = $3; heap[$1] = $4; next }
+            if (!($1 in us)) next
+            printf "%-20s %9d %9d %9d %9d\n", $1, us[$1], $3, heap[$1], $4
+            t1 += us[$1]; t2 += $3; h1 += heap[$1]; h2 += $4
+        }
+        BEGIN { printf "%-20s %9s %9s %9s %9s\n", "module", "py us", "mpy us", "py b", "mpy b" }
+        END { printf "%-20s %9d %9d %9d %9d\n", "total", t1, t2, h1, h2 }
+    ' "$BUILD/imports-py.txt" "$BUILD/imports-mpy.txt"
+else
+    deploy "$SOURCE"
+fi
 
 echo "=== Upload Complete ==="
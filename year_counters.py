@@ -0,0 +1,94 @@
+from network import setting
+
+_SELECT = """
+from(bucket: "home")
+  |> range(start: {start}, stop: {stop})
+  |> filter(fn: (r) => r["_measurement"] == "powerflow-calculated" and r["_field"] == "{field}")
+  |> keep(columns: ["_time", "_value"])"""
+
+
+class YearCounters:
+    """Calendar year totals of cumulative energy counters, kept incrementally
+
+    A full scan since 1 January sets a checkpoint per field: the year total
+    (sum of non-negative differences, in kWh) and the newest counter
+    reading. Later cycles only look up the newest reading since the
+    checkpoint with last() and add its increase. A counter that went
+    backwards is taken as reset to zero. A new year, and a full scan every
+    YEAR_RESYNC seconds (default one day), start over from a scan.
+
+    fields maps metric keys to counter fields, e.g. {'PV_YEAR': 'E_PV'}.
+    """
+
+    def __init__(self, fields, resync=86400):
+        self.fields = fields
+        self.resync = setting("YEAR_RESYNC", resync)
+        self._checkpoint = None  # epoch of the last update
+        self._synced = None  # epoch of the last full scan
+        self._total = {}
+        self._last = {}
+        self._pending = None
+
+    def queries(self, t, start):
+        """Flux queries to run at epoch t in the year starting at epoch start, named by result"""
+        queries = {}
+        if self._checkpoint is None or self._synced < start or t - self._synced >= self.resync:
+            self._pending = ('sync', t)
+            for field in self.fields.values():
+                select = _SELECT.format(start=start, stop=t, field=field)
+                queries[f'{field}_sum'] = select + """
+  |> difference(nonNegative: true)
+  |> sum()"""
+                queries[f'{field}_last'] = select + "\n  |> last()"
+        else:
+            self._pending = ('delta', t)
+            for field in self.fields.values():
+                queries[f'{field}_new'] = _SELECT.format(
+                    start=self._checkpoint, stop=t, field=field) + "\n  |> last()"
+        return queries
+
+    def update(self, vals):
+        """Apply the results of queries(), return {key: year total in kWh}"""
+        if self._pending is None or not vals:
+            # Request failed: keep the checkpoint, ask again next time
+            return {}
+        mode, t = self._pending
+        self._pending = None
+
+        if mode == 'sync':
+            for field in self.fields.values():
+                if f'{field}_sum' not in vals:
+                    return {}
+            for field in self.fields.values():
+                self._total[field] = vals[f'{field}_sum'] / 1000.0
+                self._last[field] = vals.get(f'{field}_last', 0.0)
+            self._synced = t
+        else:
+            for field in self.fields.values():
+                new = vals.get(f'{field}_new')
+                if new is not None:
+                    self._total[field] += _increase(self._last[field], new) / 1000.0
+                    self._last[field] = new
+        self._checkpoint = t
+
+        return {key: self._total[field] for key, field in self.fields.items()}
+
+    def state(self):
+        """Checkpoint as (checkpoint, synced, [(total, last) per field]), None before the first scan"""
+        if self._checkpoint is None:
+            return None
+        return self._checkpoint, self._synced, [
+            (self._total[f], self._last[f]) for f in self.fields.values()
+        ]
+
+    def restore(self, checkpoint, synced, counters):
+        self._checkpoint = checkpoint
+        self._synced = synced
+        for field, (total, last) in zip(self.fields.values(), counters):
+            self._total[field] = total
+            self._last[field] = last
+
+
+def _increase(before, after):
+    """Counter increase from before to after, after a reset counting from zero"""
+    return after - before if after >= before else after